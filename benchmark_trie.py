@@ -0,0 +1,71 @@
+#========# Benchmark del autocompletado (trie de prefijos) ========#
+#==Uso: python benchmark_trie.py [cantidad_de_nombres]  (por defecto 1_000_000)==#
+#==Compara completar un prefijo con el trie contra recorrer toda la lista.==#
+import random # Nombres y poblaciones sintéticas
+import sys # Argumentos de línea de comandos
+import time # Medición de tiempos
+
+import main # Funciones del programa principal
+
+
+SILABAS = ["ka", "lo", "ma", "ri", "sa", "ne", "to", "bu", "chi", "an", "el", "or", "us", "ia", "ta", "pe", "gu", "ay"]
+
+
+def generar_datos(n: int) -> list[dict[str, object]]:
+    random.seed(2024)
+    datos: list[dict[str, object]] = []
+    for _ in range(n):
+        nombre = "".join(random.choice(SILABAS) for _ in range(random.randint(2, 5))).capitalize()
+        datos.append({
+            "nombre": nombre,
+            "poblacion": random.randint(1, 1_500_000_000),
+            "superficie": random.randint(1, 17_000_000),
+            "continente": random.choice(["América", "Europa", "Asia", "África", "Oceanía"]),
+        })
+    return datos
+
+
+def completar_lineal(datos: list[dict[str, object]], prefijo: str, n: int) -> list[dict[str, object]]:
+    q = main.normalizar_busqueda(prefijo)
+    candidatos = [r for r in datos if main.normalizar_busqueda(str(r["nombre"])).startswith(q)]
+    candidatos.sort(key=lambda r: int(r["poblacion"]), reverse=True)
+    return candidatos[:n]
+
+
+def medir() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 1_000_000
+    print(f"[INFO] Generando {n:,} nombres...".replace(",", "."))
+    datos = generar_datos(n)
+    sesion = main.nueva_sesion()  # Guarda el trie entre llamadas, como en el menú
+
+    t0 = time.perf_counter()
+    main.autocompletar_nombre(datos, "a", sesion=sesion)  # construye el trie
+    print(f"[OK] Construcción del trie: {time.perf_counter() - t0:.2f} s")
+
+    prefijos = ["k", "ka", "kalo", "sane", "chita", "orusia"]
+    repeticiones = 1000
+    for p in prefijos:
+        t0 = time.perf_counter()
+        for _ in range(repeticiones):
+            res = main.autocompletar_nombre(datos, p, 5, sesion=sesion)
+        t_trie = (time.perf_counter() - t0) / repeticiones
+
+        t0 = time.perf_counter()
+        esperado = completar_lineal(datos, p, 5)
+        t_lineal = time.perf_counter() - t0
+
+        iguales = [int(r["poblacion"]) for r in res] == [int(r["poblacion"]) for r in esperado]
+        print(f"- '{p}': trie {t_trie * 1e6:8.1f} µs | lineal {t_lineal * 1e3:8.1f} ms | coincide: {iguales}")
+
+    # Cambios de población: recalcula sólo los top del camino del nombre
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        i = random.randrange(n)
+        anterior = dict(datos[i])
+        datos[i]["poblacion"] = random.randint(1, 1_500_000_000)
+        main.registrar_cambio(datos, i, anterior, sesion=sesion)
+    print(f"[OK] Actualización de población: {(time.perf_counter() - t0) / repeticiones * 1e6:.1f} µs por cambio")
+
+
+if __name__ == "__main__":
+    medir()
@@ -17,7 +17,22 @@
 
 #========# Importaciones ========#
 import csv # Módulo para manejar archivos CSV
+import hashlib # Hash de bloques del CSV vigilado
+import heapq # Vecinos más cercanos (k-d tree)
+import json # Exportar agrupamientos
+import math # Redondeos para percentiles
+import mmap # Mapeo de archivos grandes en memoria (modo fuera de memoria)
 import os # Módulo para operaciones del sistema operativo
+import random # Compactación del sketch de cuantiles
+import struct # Cabecera binaria del índice de filas
+import sys # Escritura en bloque a la salida estándar
+import threading # Vigilancia del CSV en segundo plano
+import unicodedata # Quitar acentos para búsquedas
+import zlib # Cortes de bloques definidos por el contenido
+from array import array # Columnas numéricas compactas
+from collections import OrderedDict # Caché LRU de consultas
+from collections.abc import Sequence # Vistas de solo lectura tipo lista
+from itertools import compress # Filtrado por máscara sobre columnas
 #================================#
 
 
@@ -39,6 +54,11 @@ def es_entero(texto: object) -> bool:
 def normalizar_texto(s: str) -> str:
 
     return (s or "").strip().lower()
+#================# Funcion normalizar_busqueda=================#
+#==Como normalizar_texto, pero además ignora acentos ("Japón" == "japon")==#
+def normalizar_busqueda(s: str) -> str:
+    descompuesto = unicodedata.normalize("NFKD", normalizar_texto(s))
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
 #===========================================================#
 #================# Función parsear_rango_num =================# 
 def _entero_sin_sep(s: str) -> tuple[bool, int]:
@@ -81,6 +101,44 @@ def campos_orden_validos() -> tuple[str, ...]:
 
 
 
+#================# Función _validar_fila_csv =================#
+#==Valida una fila leída del CSV y la convierte en registro==#
+def _validar_fila_csv(fila: dict[str, object]) -> tuple[dict[str, object] | None, str]:
+    """
+    Devuelve (registro, "") si la fila es válida, o (None, motivo) si debe omitirse.
+    Aplica las mismas reglas para todas las formas de carga.
+    """
+    # a) Campos de texto requeridos
+    nombre = str(fila.get("nombre", "")).strip()
+    continente = str(fila.get("continente", "")).strip()
+    if nombre == "" or continente == "":
+        return (None, "nombre/continente vacío")
+
+    # b) Normalizar números (quitar guiones bajos y espacios internos)
+    poblacion_txt = str(fila.get("poblacion", "")).replace("_", "").replace(" ", "").strip()
+    superficie_txt = str(fila.get("superficie", "")).replace("_", "").replace(" ", "").strip()
+
+    # c) Validar formato numérico sin excepciones
+    if not es_entero(poblacion_txt) or not es_entero(superficie_txt):
+        return (None, "población/superficie no numérica")
+
+    poblacion = int(poblacion_txt)
+    superficie = int(superficie_txt)
+
+    # d) Reglas de negocio (rangos)
+    if poblacion < 0:
+        return (None, "población negativa")
+    if superficie <= 0:
+        return (None, "superficie <= 0")
+
+    return ({
+        "nombre": nombre,
+        "poblacion": poblacion,
+        "superficie": superficie,
+        "continente": continente,
+    }, "")
+
+
 #=========================================================================#
 #=========Funcion cargar_csv (con validaciones)===========================#
 #==Recibe la ruta al archivo y devuelve una lista de diccionarios ==#
@@ -115,44 +173,14 @@ def cargar_csv(ruta: str) -> list[dict[str, object]]:
     fila_nro = 1  # encabezados
     for fila in lector:
         fila_nro += 1
-        # a) Campos de texto requeridos
-        nombre = str(fila.get("nombre", "")).strip()
-        continente = str(fila.get("continente", "")).strip()
-        if nombre == "" or continente == "":
-            errores += 1
-            print(f"[AVISO] Fila {fila_nro} inválida: nombre/continente vacío. Se omite.")
-            continue
-
-        # b) Normalizar números (quitar guiones bajos y espacios internos)
-        poblacion_txt = str(fila.get("poblacion", "")).replace("_", "").replace(" ", "").strip()
-        superficie_txt = str(fila.get("superficie", "")).replace("_", "").replace(" ", "").strip()
-
-        # c) Validar formato numérico sin excepciones
-        if not es_entero(poblacion_txt) or not es_entero(superficie_txt):
-            errores += 1
-            print(f"[AVISO] Fila {fila_nro} inválida: población/superficie no numérica. Se omite.")
-            continue
-
-        poblacion = int(poblacion_txt)
-        superficie = int(superficie_txt)
-
-        # d) Reglas de negocio (rangos)
-        if poblacion < 0:
+        registro, motivo = _validar_fila_csv(fila)
+        if registro is None:
             errores += 1
-            print(f"[AVISO] Fila {fila_nro} inválida: población negativa. Se omite.")
-            continue
-        if superficie <= 0:
-            errores += 1
-            print(f"[AVISO] Fila {fila_nro} inválida: superficie <= 0. Se omite.")
+            print(f"[AVISO] Fila {fila_nro} inválida: {motivo}. Se omite.")
             continue
 
         # e) Si todo está bien, agregar dict[str, object]
-        datos.append({
-            "nombre": nombre,
-            "poblacion": poblacion,
-            "superficie": superficie,
-            "continente": continente,
-        })
+        datos.append(registro)
 
     # 5) Cerrar archivo y reportar
     f.close()
@@ -162,7 +190,7 @@ def cargar_csv(ruta: str) -> list[dict[str, object]]:
 #========================================#
 # Guardar CSV
 #========================================#
-def guardar_csv(ruta: str, datos: list[dict[str, object]]) -> None:
+def guardar_csv(ruta: str, datos: list[dict[str, object]], sesion: dict[str, object] | None = None) -> None:
     """
     Sobrescribe el archivo CSV 'ruta' con el contenido de 'datos',
     respetando los encabezados: nombre,poblacion,superficie,continente.
@@ -183,6 +211,10 @@ def guardar_csv(ruta: str, datos: list[dict[str, object]]) -> None:
         print("[INFO] No hay datos para guardar.")
         return
 
+    # Si el archivo se está vigilando, incorporar antes lo que cambió en disco
+    if sesion is not None and not sincronizar_antes_de_guardar(ruta, datos, sesion):
+        return
+
     # Validar que cada dict[str, object] tenga las claves y tipos correctos
     for idx, r in enumerate(datos, start=1):
         if not isinstance(r, dict):
@@ -224,11 +256,327 @@ def guardar_csv(ruta: str, datos: list[dict[str, object]]) -> None:
             "superficie": int(str(r.get("superficie", "")).replace("_","").replace(" ","") or "0"),
             "continente": str(r.get("continente", "")).strip(),
         })
+    f.close()
+    if sesion is not None:
+        registrar_guardado(ruta, sesion)
     print(f"[OK] Cambios guardados en: {ruta}")
 #========================================#
 
 
 
+#=========================================================================#
+#=========Modo fuera de memoria (CSV mapeado + índice de filas)===========#
+#==Para CSV más grandes que la RAM: el archivo se mapea con mmap y en====#
+#==memoria sólo quedan los offsets de cada fila y las columnas numéricas.#
+#==nombre/continente se decodifican recién al mostrar un registro.=======#
+#=========================================================================#
+_IDX_MAGIA = b"TPIIDX01"
+# magia, tamaño del CSV, mtime_ns del CSV, filas válidas, filas con error, bytes de continentes
+_IDX_CABECERA = struct.Struct("<8sQQQQQ")
+
+
+def ruta_indice(ruta: str) -> str:
+    """Ruta del índice de filas persistido junto al CSV."""
+    return ruta + ".idx"
+
+
+def _campos_linea(texto: str) -> list[str]:
+    # Camino rápido: sin comillas alcanza con split; si hay comillas, usar csv
+    if '"' in texto:
+        return next(csv.reader([texto]), [])
+    return texto.split(",")
+
+
+class CSVMapeado(Sequence):
+    """
+    Vista de solo lectura sobre un CSV mapeado en memoria.
+    Se comporta como una lista de registros (len, índices, slices, iteración),
+    pero cada dict se arma recién cuando se lo pide. Los filtros y ordenamientos
+    devuelven otra vista que comparte el mismo archivo y columnas.
+    """
+
+    def __init__(self, base: dict[str, object], filas: array | None = None) -> None:
+        self._base = base    # mmap, offsets y columnas compartidas entre vistas
+        self._sel = filas    # None = todas las filas válidas del archivo
+
+    #==Acceso tipo lista==#
+    def __len__(self) -> int:
+        if self._sel is not None:
+            return len(self._sel)
+        return len(self._base["offsets"])
+
+    def __getitem__(self, i):
+        # los nombres se leen del archivo: si cambió, los offsets apuntan a cualquier lado
+        if isinstance(i, slice):
+            if not self._verificar():
+                return []
+            return [self._decodificar(self._fila(j)) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("índice fuera de rango")
+        if not self._verificar():
+            raise IndexError("el CSV mapeado cambió en disco")
+        return self._decodificar(self._fila(i))
+
+    def __iter__(self):
+        if not self._verificar():
+            return
+        for fila in self._filas():
+            yield self._decodificar(fila)
+
+    def _verificar(self) -> bool:
+        if self.vigente():
+            return True
+        print("[AVISO] El CSV mapeado cambió en disco; no se leen sus filas. Vuelva al menú principal para reindexarlo.")
+        return False
+
+    def _fila(self, i: int) -> int:
+        return self._sel[i] if self._sel is not None else i
+
+    def _filas(self):
+        return self._sel if self._sel is not None else range(len(self._base["offsets"]))
+
+    def _texto_fila(self, fila: int) -> str:
+        mm = self._base["mm"]
+        inicio = self._base["offsets"][fila]
+        fin = mm.find(b"\n", inicio)
+        if fin == -1:
+            fin = len(mm)
+        return mm[inicio:fin].decode("utf-8").rstrip("\r")
+
+    def _nombre(self, fila: int) -> str:
+        campos = _campos_linea(self._texto_fila(fila))
+        col = self._base["col_nombre"]
+        return campos[col].strip() if col < len(campos) else ""
+
+    def _decodificar(self, fila: int) -> dict[str, object]:
+        return {
+            "nombre": self._nombre(fila),
+            "poblacion": self._base["poblacion"][fila],
+            "superficie": self._base["superficie"][fila],
+            "continente": self._base["continentes"][self._base["cod_continente"][fila]],
+        }
+
+    #==Operaciones sobre columnas compactas (sin decodificar texto)==#
+    @property
+    def ruta(self) -> str:
+        return str(self._base["ruta"])
+
+    def columna(self, campo: str) -> array:
+        """Valores de 'poblacion' o 'superficie' de las filas de esta vista."""
+        col = self._base[campo]
+        if self._sel is None:
+            return col
+        return array("q", (col[f] for f in self._sel))
+
+    def continentes(self) -> list[str]:
+        """Continentes distintos tal como aparecen en el CSV."""
+        return list(self._base["continentes"])
+
+    def conteo_continentes(self) -> dict[str, int]:
+        cod = self._base["cod_continente"]
+        nombres = self._base["continentes"]
+        conteo: dict[str, int] = {}
+        for f in self._filas():
+            c = nombres[cod[f]]
+            conteo[c] = conteo.get(c, 0) + 1
+        return conteo
+
+    def filas_numericas(self):
+        """(poblacion, superficie, continente) de cada fila, sin leer el archivo."""
+        pob = self._base["poblacion"]
+        sup = self._base["superficie"]
+        cod = self._base["cod_continente"]
+        nombres = self._base["continentes"]
+        for f in self._filas():
+            yield (pob[f], sup[f], nombres[cod[f]])
+
+    def filtrar_rango(self, campo: str, rango: tuple[int | None, int | None]) -> "CSVMapeado":
+        mn, mx = rango
+        col = self._base[campo]
+        filas = self._filas()
+        if mn is None and mx is None:
+            return CSVMapeado(self._base, array("Q", filas))
+        if mx is None:
+            ok = (col[f] >= mn for f in filas)
+        elif mn is None:
+            ok = (col[f] <= mx for f in filas)
+        else:
+            ok = (mn <= col[f] <= mx for f in filas)
+        return CSVMapeado(self._base, array("Q", compress(filas, ok)))
+
+    def filtrar_continente(self, continente: str) -> "CSVMapeado":
+        q = (continente or "").strip().lower()
+        codigos = {i for i, c in enumerate(self._base["continentes"]) if c.strip().lower() == q}
+        cod = self._base["cod_continente"]
+        filas = self._filas()
+        return CSVMapeado(self._base, array("Q", compress(filas, (cod[f] in codigos for f in filas))))
+
+    def ordenar(self, campo: str, descendente: bool = False) -> "CSVMapeado":
+        """Ordena por 'poblacion' o 'superficie' (por nombre habría que cargar todos los nombres)."""
+        clave = self._base[campo].__getitem__
+        return CSVMapeado(self._base, array("Q", sorted(self._filas(), key=clave, reverse=descendente)))
+
+    def vigente(self) -> bool:
+        """False si el CSV cambió en disco después de mapearlo: los offsets ya no sirven."""
+        ruta = str(self._base["ruta"])
+        if self._base["mm"].closed or not os.path.isfile(ruta):
+            return False
+        st = os.stat(ruta)
+        return (st.st_size, st.st_mtime_ns) == self._base["firma"]
+
+    def cerrar(self) -> None:
+        """Libera el mapeo y el archivo (afecta a todas las vistas)."""
+        if not self._base["mm"].closed:
+            self._base["mm"].close()
+            self._base["f"].close()
+
+
+#==Construye el índice de filas y las columnas numéricas en una sola pasada==#
+def _construir_indice_mapeado(mm: mmap.mmap, encabezados: list[str], inicio: int) -> dict[str, object]:
+    offsets = array("Q")
+    poblacion = array("q")
+    superficie = array("q")
+    cod_continente = array("I")
+    continentes: list[str] = []
+    codigos: dict[str, int] = {}
+    errores = 0
+
+    fila_nro = 1  # encabezados
+    pos = inicio
+    mm.seek(inicio)
+    for linea in iter(mm.readline, b""):
+        offset = pos
+        pos += len(linea)
+        texto = linea.decode("utf-8").rstrip("\r\n")
+        if texto.strip() == "":
+            continue  # igual que DictReader: las líneas vacías no cuentan como fila
+        fila_nro += 1
+        registro, motivo = _validar_fila_csv(dict(zip(encabezados, _campos_linea(texto))))
+        if registro is None:
+            errores += 1
+            print(f"[AVISO] Fila {fila_nro} inválida: {motivo}. Se omite.")
+            continue
+        cont = str(registro["continente"])
+        if cont not in codigos:
+            codigos[cont] = len(continentes)
+            continentes.append(cont)
+        offsets.append(offset)
+        poblacion.append(int(registro["poblacion"]))
+        superficie.append(int(registro["superficie"]))
+        cod_continente.append(codigos[cont])
+
+    return {
+        "offsets": offsets,
+        "poblacion": poblacion,
+        "superficie": superficie,
+        "cod_continente": cod_continente,
+        "continentes": continentes,
+        "errores": errores,
+    }
+
+
+#==Guarda el índice junto al CSV para reutilizarlo en la próxima carga==#
+def _guardar_indice_mapeado(ruta: str, st: os.stat_result, idx: dict[str, object]) -> None:
+    if not os.access(os.path.dirname(ruta) or ".", os.W_OK):
+        print("[AVISO] No se puede escribir el índice junto al CSV; se reconstruirá en la próxima carga.")
+        return
+    conts = "\n".join(idx["continentes"]).encode("utf-8")
+    f = open(ruta_indice(ruta), "wb")
+    f.write(_IDX_CABECERA.pack(_IDX_MAGIA, st.st_size, st.st_mtime_ns,
+                               len(idx["offsets"]), idx["errores"], len(conts)))
+    f.write(conts)
+    for clave in ("offsets", "poblacion", "superficie", "cod_continente"):
+        idx[clave].tofile(f)
+    f.close()
+
+
+#==Lee el índice persistido; None si no existe o no corresponde al CSV actual==#
+def _leer_indice_mapeado(ruta: str, st: os.stat_result) -> dict[str, object] | None:
+    ruta_idx = ruta_indice(ruta)
+    if not os.path.isfile(ruta_idx):
+        return None
+    f = open(ruta_idx, "rb")
+    cab = f.read(_IDX_CABECERA.size)
+    if len(cab) != _IDX_CABECERA.size:
+        f.close()
+        return None
+    magia, tam, mtime_ns, n, errores, n_conts = _IDX_CABECERA.unpack(cab)
+    if magia != _IDX_MAGIA or tam != st.st_size or mtime_ns != st.st_mtime_ns:
+        f.close()
+        return None
+    # Validar que el archivo tenga exactamente el tamaño esperado antes de leer
+    esperado = _IDX_CABECERA.size + n_conts + n * (8 + 8 + 8 + array("I").itemsize)
+    if os.path.getsize(ruta_idx) != esperado:
+        f.close()
+        return None
+    conts = f.read(n_conts).decode("utf-8")
+    idx: dict[str, object] = {
+        "continentes": conts.split("\n") if conts else [],
+        "errores": errores,
+    }
+    for clave, tipo in (("offsets", "Q"), ("poblacion", "q"), ("superficie", "q"), ("cod_continente", "I")):
+        col = array(tipo)
+        col.fromfile(f, n)
+        idx[clave] = col
+    f.close()
+    return idx
+
+
+#================# Función cargar_csv_mapeado =================#
+#==Variante de cargar_csv para archivos que no entran en memoria==#
+def cargar_csv_mapeado(ruta: str) -> CSVMapeado | list[dict[str, object]]:
+    """
+    Mapea el CSV con mmap y construye (o reutiliza) el índice de filas '<ruta>.idx'.
+    Aplica las mismas validaciones que cargar_csv. Devuelve [] si no se pudo cargar.
+    Limitación: cada registro debe ocupar una sola línea del archivo.
+    """
+    # 1) Validar existencia del archivo
+    if not isinstance(ruta, str) or ruta.strip() == "":
+        print("[ERROR] Ruta inválida.")
+        return []
+    if not os.path.exists(ruta):
+        print(f"[ERROR] No se encontró el archivo: {ruta}")
+        return []
+    st = os.stat(ruta)
+    if st.st_size == 0:
+        print(f"[ERROR] Encabezados faltantes: {campos_csv()}. Se esperaban: {campos_csv()}")
+        return []
+
+    # 2) Mapear archivo y leer encabezados
+    f = open(ruta, "rb")
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    inicio = 3 if mm[:3] == b"\xef\xbb\xbf" else 0  # evitar BOM en encabezados
+    fin = mm.find(b"\n", inicio)
+    if fin == -1:
+        fin = len(mm)
+    encabezados = [c.strip() for c in _campos_linea(mm[inicio:fin].decode("utf-8").rstrip("\r"))]
+    faltantes = [c for c in campos_csv() if c not in encabezados]
+    if len(faltantes) > 0:
+        print(f"[ERROR] Encabezados faltantes: {faltantes}. Se esperaban: {campos_csv()}")
+        mm.close()
+        f.close()
+        return []
+
+    # 3) Reutilizar índice persistido o construirlo en una pasada
+    idx = _leer_indice_mapeado(ruta, st)
+    if idx is None:
+        idx = _construir_indice_mapeado(mm, encabezados, min(fin + 1, len(mm)))
+        _guardar_indice_mapeado(ruta, st, idx)
+    else:
+        print(f"[INFO] Reutilizando índice: {ruta_indice(ruta)}")
+
+    idx["ruta"] = ruta
+    idx["firma"] = (st.st_size, st.st_mtime_ns)  # para detectar si el archivo cambia mientras está mapeado
+    idx["f"] = f
+    idx["mm"] = mm
+    idx["col_nombre"] = encabezados.index("nombre")
+    print(f"[OK] registros indexados: {len(idx['offsets'])}. Filas con error omitidas: {idx['errores']}.")
+    return CSVMapeado(idx)
+#=============================================================#
+
+
 #=========================#
 # Continentes (opciones)
 #=========================#
@@ -239,6 +587,9 @@ def _canon_continentes(datos: list[dict[str, object]]) -> list[str]:
     respetando mayúsculas/acentos según aparecen en el CSV.
     Si hay variantes (ej. 'América', 'america'), usa la primera que encuentre.
     """
+    if isinstance(datos, CSVMapeado):
+        # modo fuera de memoria: los continentes ya están en el índice
+        return sorted({c.lower(): c for c in reversed(datos.continentes())}.values(), key=lambda s: s.casefold())
     vistos: dict[str, str] = {}
     for r in datos:
         raw = str(r.get("continente", "")).strip()
@@ -250,12 +601,13 @@ def _canon_continentes(datos: list[dict[str, object]]) -> list[str]:
     # ordenar por forma mostrada (estética; no afecta la “canonicidad”)
     return sorted(vistos.values(), key=lambda s: s.casefold())
 #==Función para elegir continente==#
-def elegir_continente(datos: list[dict[str, object]]) -> str:
+def elegir_continente(datos: list[dict[str, object]], sesion: dict[str, object] | None = None) -> str:
     """
     Muestra un menú con continentes existentes y permite elegir uno.
-    Incluye la opción 'Otro' para escribir manualmente.
+    Incluye la opción 'Otro' para escribir manualmente (con sugerencias).
     """
-    opciones = _canon_continentes(datos)
+    # La lista de opciones sale del trie de continentes (no se recalcula en cada llamada)
+    opciones = _trie_continentes(datos, _indices(sesion))["opciones"] if isinstance(datos, list) else _canon_continentes(datos)
     if not opciones:
         # fallback: si no hay datos, pedir texto libre
         cont = input("Continente: ").strip()
@@ -273,7 +625,12 @@ def elegir_continente(datos: list[dict[str, object]]) -> str:
             if 1 <= n <= len(opciones):
                 return opciones[n-1]
             if n == len(opciones) + 1:
-                cont = elegir_continente(datos).strip()
+                cont = input("Continente: ").strip()
+                sugeridos = autocompletar_continente(datos, cont, 1, sesion) if cont else []
+                if sugeridos and normalizar_busqueda(sugeridos[0]) != normalizar_busqueda(cont):
+                    ok = input(f"¿Quiso decir '{sugeridos[0]}'? [s/N]: ").strip().lower()
+                    if ok == "s":
+                        return sugeridos[0]
                 return cont
         print("[ERROR] Opción inválida. Intente nuevamente.")
 
@@ -284,11 +641,128 @@ def elegir_continente(datos: list[dict[str, object]]) -> str:
 #================# Función mostrar_registro[str, object] =================#
 #==Imprime un país en una línea legible==#
 def mostrar_registro(r: dict[str, object]) -> None:
-    print(
-        f"- {r['nombre']} | Población: {r['poblacion']:,} | "
-        f"Superficie: {r['superficie']:,} km² | Continente: {r['continente']}"
-        .replace(",", ".")
-    )
+    sys.stdout.write(formatear_registros([r]))
+#==========================================================#
+
+
+#=========================#
+#  Salida en bloque y exportación de resultados
+#=========================#
+def _miles(n: object) -> str:
+    # separador de miles con punto (sólo a los números, no a los nombres)
+    return f"{n:,}".replace(",", ".")
+
+
+#================# Función formatear_registros =================#
+#==Arma todas las líneas de una vez (formato lista o tabla alineada)==#
+def formatear_registros(registros: list[dict[str, object]], tabla: bool = False) -> str:
+    if not tabla:
+        return "".join(
+            f"- {r['nombre']} | Población: {_miles(r['poblacion'])} | "
+            f"Superficie: {_miles(r['superficie'])} km² | Continente: {r['continente']}\n"
+            for r in registros
+        )
+    filas = [(str(r["nombre"]), _miles(r["poblacion"]), _miles(r["superficie"]), str(r["continente"])) for r in registros]
+    encabezado = ("Nombre", "Población", "Superficie (km²)", "Continente")
+    anchos = [max([len(encabezado[c])] + [len(f[c]) for f in filas]) for c in range(4)]
+    formato = f"{{:<{anchos[0]}}} | {{:>{anchos[1]}}} | {{:>{anchos[2]}}} | {{}}\n"
+    separador = "-+-".join("-" * a for a in anchos) + "\n"
+    return formato.format(*encabezado) + separador + "".join(formato.format(*f) for f in filas)
+
+
+#================# Función mostrar_registros =================#
+#==Muestra varios países con una sola escritura a la salida estándar==#
+def mostrar_registros(registros: list[dict[str, object]], tabla: bool = False) -> None:
+    sys.stdout.write(formatear_registros(registros, tabla))
+
+
+def formatos_exportacion() -> tuple[str, ...]:
+    return ("csv", "ndjson", "json")
+
+
+#================# Función exportar_registros =================#
+#==Escribe los registros a un archivo a medida que se recorren (sin armar todo en memoria)==#
+def _destino_protegido(ruta: str, ruta_csv: str | None) -> bool:
+    """True si 'ruta' es el CSV cargado o su índice '.idx' (exportar encima los destruiría)."""
+    if not ruta_csv:
+        return False
+    destino = os.path.abspath(ruta)
+    return destino in (os.path.abspath(ruta_csv), os.path.abspath(ruta_indice(ruta_csv)))
+
+
+def exportar_registros(registros, ruta: str, formato: str, ruta_csv: str | None = None) -> int:
+    """
+    Exporta cualquier resultado (lista o vista del modo fuera de memoria) en
+    formato csv, ndjson (un JSON por línea) o json (arreglo). Devuelve la
+    cantidad de registros escritos, o -1 si no se pudo exportar.
+    No escribe sobre el CSV cargado (ruta_csv) ni sobre su índice; en modo
+    fuera de memoria el archivo mapeado se protege siempre.
+    """
+    if formato not in formatos_exportacion():
+        print(f"[ERROR] Formato no válido. Use uno de: {list(formatos_exportacion())}")
+        return -1
+    if not isinstance(ruta, str) or ruta.strip() == "":
+        print("[ERROR] Ruta inválida.")
+        return -1
+    ruta = ruta.strip()
+    dirpath = os.path.dirname(ruta) or "."
+    if not os.path.isdir(dirpath):
+        print(f"[ERROR] La carpeta de destino no existe: {dirpath}")
+        return -1
+    if _destino_protegido(ruta, ruta_csv) or (isinstance(registros, CSVMapeado) and _destino_protegido(ruta, registros.ruta)):
+        print(f"[ERROR] No se puede exportar sobre el CSV cargado ni sobre su índice: {ruta}")
+        return -1
+
+    contador = [0]
+
+    def contar(regs):
+        for r in regs:
+            contador[0] += 1
+            yield r
+
+    f = open(ruta, "w", encoding="utf-8", newline="")
+    campos = campos_csv()
+    if formato == "csv":
+        writer = csv.writer(f)
+        writer.writerow(campos)
+        writer.writerows([r[c] for c in campos] for r in contar(registros))
+    elif formato == "ndjson":
+        codificador = json.JSONEncoder(ensure_ascii=False)
+        f.writelines(codificador.encode({c: r[c] for c in campos}) + "\n" for r in contar(registros))
+    else:
+        codificador = json.JSONEncoder(ensure_ascii=False)
+        f.write("[\n")
+        primero = True
+        for r in contar(registros):
+            f.write(("" if primero else ",\n") + codificador.encode({c: r[c] for c in campos}))
+            primero = False
+        f.write("\n]\n")
+    f.close()
+    print(f"[OK] {contador[0]} registro(s) exportado(s) a: {ruta}")
+    return contador[0]
+
+
+#================# Función ofrecer_salida =================#
+#==Después de un listado: ver como tabla o exportar el resultado completo==#
+def ofrecer_salida(registros, limite: int = 50, ruta_actual: str | None = None) -> None:
+    op = input("Enter = continuar | T = ver como tabla | C/N/J = exportar a CSV/NDJSON/JSON: ").strip().lower()
+    if op == "":
+        return
+    if op == "t":
+        mostrar_registros(registros[:limite], tabla=True)
+        return
+    formato = {"c": "csv", "n": "ndjson", "j": "json"}.get(op)
+    if formato is None:
+        print("[ERROR] Opción inválida.")
+        return
+    ruta = input(f"Archivo de salida [Enter para 'resultados.{formato}']: ").strip() or f"resultados.{formato}"
+    if _destino_protegido(ruta, ruta_actual) or (isinstance(registros, CSVMapeado) and _destino_protegido(ruta, registros.ruta)):
+        print(f"[ERROR] No se puede exportar sobre el CSV cargado ni sobre su índice: {ruta}")
+        return
+    if os.path.exists(ruta) and input(f"El archivo '{ruta}' ya existe. ¿Sobrescribir? [s/N]: ").strip().lower() != "s":
+        print("[INFO] Exportación cancelada.")
+        return
+    exportar_registros(registros, ruta, formato, ruta_actual)
 #==========================================================#
 
 
@@ -305,8 +779,17 @@ def menu() -> None:
     datos: list[dict[str, object]] = [] # Lista para almacenar los dict[str, object]s cargados
     ruta_csv_por_defecto = "data/paises.csv" # Ruta por defecto del archivo CSV
     ruta_actual = None  # Variable para almacenar la ruta actual del CSV cargado
+    sesion = nueva_sesion() # Índices, caché, cambios sin guardar y vigilancia de los datos cargados
 
     while True: # Bucle infinito hasta que el usuario decida salir
+        aplicar_cambios_externos(datos, sesion) # Incorpora cambios del CSV en disco si se está vigilando
+        if isinstance(datos, CSVMapeado) and not datos.vigente(): # El CSV mapeado cambió: los offsets quedaron viejos
+            print(f"[AVISO] El CSV mapeado cambió en disco: {datos.ruta}. Se vuelve a indexar.")
+            datos.cerrar()
+            reiniciar_sesion(sesion) # Los índices y el caché eran del mapeo anterior
+            datos = cargar_csv_mapeado(datos.ruta) if os.path.isfile(datos.ruta) else []
+            if not datos:
+                ruta_actual = None
         print("\n=== GESTIÓN DE PAÍSES (Iteración 1) ===") # Título del menú
         print("1) Cargar CSV") # Opción para cargar el archivo CSV
         print("2) Buscar país por nombre (parcial o exacta)") # Opción para buscar un país por nombre
@@ -317,6 +800,9 @@ def menu() -> None:
         print("7) Agregar país")  
         print("8) Guardar cambios en CSV")  # debajo del "7) Agregar país"
         print("9) Actualizar país (población y superficie)")
+        print("10) Comparar/fusionar con otro CSV")
+        print(f"11) Vigilar cambios del CSV en disco ({'activo' if vigilancia_activa(sesion) else 'inactivo'})")
+        print("12) Configurar caché de consultas")
 
         print("0) Salir") # Opción para salir del programa
         opcion = input("Elija una opción: ").strip() # Solicita al usuario que elija una opción
@@ -325,7 +811,11 @@ def menu() -> None:
             ruta = input(f"Ingrese ruta CSV [Enter para '{ruta_csv_por_defecto}']: ").strip() # Solicita la ruta del archivo CSV
             if not ruta: # Si no se ingresa una ruta, usa la ruta por defecto
                 ruta = ruta_csv_por_defecto # Usa la ruta por defecto
-            datos = cargar_csv(ruta) # Carga los datos del archivo CSV
+            fuera_mem = input("¿Modo fuera de memoria para archivos grandes? [s/N]: ").strip().lower() == "s"
+            if isinstance(datos, CSVMapeado): # Libera el mapeo anterior antes de recargar
+                datos.cerrar()
+            reiniciar_sesion(sesion) # Índices, caché y vigilancia corresponden al dataset anterior
+            datos = cargar_csv_mapeado(ruta) if fuera_mem else cargar_csv(ruta) # Carga los datos del archivo CSV
             ruta_actual = ruta  # Actualiza la ruta actual del CSV cargado
 
         elif opcion == "2": # Si el usuario elige la opción 2
@@ -333,24 +823,43 @@ def menu() -> None:
                 print("[INFO] No hay datos cargados. Use la opción 1 primero.") # Informa al usuario que no hay datos cargados
                 continue
             q = input("Nombre a buscar (parcial o exacto): ").strip() # Solicita el nombre a buscar
-            modo = input("Modo (P=parcial / E=exacta) [P/E]: ").strip().lower()
-            modo_final = "exacta" if modo == "e" else "parcial"
-            resultados = buscar_por_nombre(datos, q, modo_final) # Busca los países que coinciden con el nombre ingresado
+            modo = input("Modo (P=parcial / E=exacta / D=difusa, tolera errores / V=países similares) [P/E/D/V]: ").strip().lower()
+            if modo == "v" and isinstance(datos, CSVMapeado): # El k-d tree necesitaría un punto por registro en memoria
+                print("[INFO] Modo fuera de memoria: la búsqueda de países similares no está disponible. Cargue el CSV en modo normal.")
+                continue
+            if modo == "v": # Países parecidos en población y superficie al elegido
+                submenu_similares(datos, q, sesion=sesion)
+                continue
+            if modo == "d" and isinstance(datos, CSVMapeado): # El BK-tree necesitaría todos los nombres en memoria
+                print("[INFO] Modo fuera de memoria: la búsqueda difusa no está disponible. Use P o E, o cargue el CSV en modo normal.")
+                continue
+            modo_final = {"e": "exacta", "d": "difusa"}.get(modo, "parcial")
+            resultados = buscar_por_nombre(datos, q, modo_final, sesion=sesion) # Busca los países que coinciden con el nombre ingresado
             if resultados: # Si se encontraron resultados
                 print(f"[OK] Se encontraron {len(resultados)} coincidencia(s):") # Informa la cantidad de coincidencias encontradas
-                for r in resultados: # Itera sobre los resultados encontrados
-                    mostrar_registro(r) # Muestra cada dict[str, object] encontrado
+                mostrar_registros(resultados) # Muestra todos los resultados de una vez
+                ofrecer_salida(resultados, len(resultados), ruta_actual) # Permite verlos como tabla o exportarlos
             else: # Si no se encontraron resultados
                 print("[INFO] No se encontraron países para esa búsqueda.") # Informa al usuario que no se encontraron países
+                if isinstance(datos, CSVMapeado): # Las sugerencias arman índices con todos los nombres en memoria
+                    continue
+                # Sólo lo que puede encontrar algo: una búsqueda parcial fallida no tiene nombres que empiecen igual,
+                # y una difusa fallida no va a encontrar nada parecido con la misma tolerancia
+                sugeridos = autocompletar_nombre(datos, q, 5, sesion=sesion) if modo_final != "parcial" else []
+                if not sugeridos and modo_final != "difusa":
+                    sugeridos = buscar_por_nombre(datos, q, "difusa", sesion=sesion)[:5]
+                if sugeridos:
+                    print("[INFO] ¿Quiso decir?: " + ", ".join(str(r["nombre"]) for r in sugeridos))
 
         elif opcion == "3": # Si el usuario elige la opción 3
             print(f"[INFO] Total de registros cargados: {len(datos)}") # Muestra el total de dict[str, object]s cargados
+            mostrar_estadisticas_cache(sesion) # Muestra aciertos/fallos/desalojos del caché de consultas
 
         elif opcion == "4": # Si el usuario elige la opción 4
-            submenu_filtros(datos) # Llama al submenú de filtros
+            submenu_filtros(datos, ruta_actual, sesion) # Llama al submenú de filtros
 
         elif opcion == "5": # Si el usuario elige la opción 5
-            submenu_ordenamientos(datos) # Llama al submenú de ordenamientos
+            submenu_ordenamientos(datos, ruta_actual, sesion) # Llama al submenú de ordenamientos
 
         elif opcion == "6": # Si el usuario elige la opción 6
             submenu_estadisticas(datos) # Llama al submenú de estadísticas
@@ -359,9 +868,12 @@ def menu() -> None:
             if not datos:   # Verifica si hay datos cargados
                 print("[INFO] No hay datos cargados. Use la opción 1 primero.") # Informa al usuario que no hay datos cargados
                 continue
-            agregar_pais(datos) # Llama a la función para agregar un país
+            if isinstance(datos, CSVMapeado): # El modo fuera de memoria es de solo lectura
+                print("[INFO] Modo fuera de memoria: solo lectura. Cargue el CSV en modo normal para editar.")
+                continue
+            agregar_pais(datos, sesion=sesion) # Llama a la función para agregar un país
             if ruta_actual:
-                guardar_csv(ruta_actual, datos)  # Guarda los cambios automáticamente si hay una ruta actual
+                guardar_csv(ruta_actual, datos, sesion)  # Guarda los cambios automáticamente si hay una ruta actual
             else:
                 print("[INFO] No hay ruta de CSV asociada aún. Use la opción 8 o cargue primero con la opción 1.")
         elif opcion == "8":  # Si el usuario elige la opción 8
@@ -369,20 +881,48 @@ def menu() -> None:
                 print("[INFO] No hay datos cargados. Use la opción 1 primero.") # Informa al usuario que no hay datos cargados
             elif not ruta_actual:  # Verifica si hay una ruta actual
                 print("[INFO] No hay ruta de CSV asociada. Use la opción 1 para cargar un archivo primero.") # Informa al usuario que no hay una ruta actual
+            elif isinstance(datos, CSVMapeado): # En modo fuera de memoria no hay cambios que guardar
+                print("[INFO] Modo fuera de memoria: solo lectura, no hay cambios para guardar.")
             else:
-                guardar_csv(ruta_actual, datos) # Guarda los cambios en el archivo CSV
+                guardar_csv(ruta_actual, datos, sesion) # Guarda los cambios en el archivo CSV
         elif opcion == "9":  # Si el usuario elige la opción 9
             if not datos:   # Verifica si hay datos cargados
                 print("[INFO] No hay datos cargados. Use la opción 1 primero.") # Informa al usuario que no hay datos cargados
                 continue
-            actualizar_pais(datos)  # Llama a la función para actualizar un país
+            if isinstance(datos, CSVMapeado): # El modo fuera de memoria es de solo lectura
+                print("[INFO] Modo fuera de memoria: solo lectura. Cargue el CSV en modo normal para editar.")
+                continue
+            actualizar_pais(datos, sesion=sesion)  # Llama a la función para actualizar un país
             if ruta_actual:
-                guardar_csv(ruta_actual, datos)  # Guarda los cambios automáticamente si hay una ruta actual
+                guardar_csv(ruta_actual, datos, sesion)  # Guarda los cambios automáticamente si hay una ruta actual
             else:
                 print("[INFO] No hay ruta de CSV asociada aún. Use la opción 8 o cargue primero con la opción 1.")  
 
+        elif opcion == "10":  # Si el usuario elige la opción 10
+            if not datos:   # Verifica si hay datos cargados
+                print("[INFO] No hay datos cargados. Use la opción 1 primero.") # Informa al usuario que no hay datos cargados
+                continue
+            if isinstance(datos, CSVMapeado): # El join por nombre necesitaría todos los nombres en memoria
+                print("[INFO] Modo fuera de memoria: comparar con otro CSV no está disponible. Cargue el CSV en modo normal.")
+                continue
+            if submenu_fusion(datos, sesion) and ruta_actual:  # Compara y, si se fusionó, guarda como en 7 y 9
+                guardar_csv(ruta_actual, datos, sesion)
+
+        elif opcion == "11":  # Si el usuario elige la opción 11
+            if vigilancia_activa(sesion): # Si ya se está vigilando, se desactiva
+                detener_vigilancia(sesion)
+            elif not datos or not ruta_actual: # Hace falta un CSV cargado
+                print("[INFO] No hay datos cargados. Use la opción 1 primero.")
+            else:
+                iniciar_vigilancia(ruta_actual, datos, sesion) # Revisa el CSV en segundo plano
+
+        elif opcion == "12":  # Si el usuario elige la opción 12
+            submenu_cache(sesion) # Cambia cantidad máxima de resultados y memoria del caché
 
         elif opcion == "0": # Si el usuario elige la opción 0
+            if isinstance(datos, CSVMapeado): # Libera el mapeo del archivo
+                datos.cerrar()
+            detener_vigilancia(sesion) # Termina el hilo de vigilancia si estaba activo
             print("¡Hasta luego!") 
             break # Sale del bucle y termina el programa
         
@@ -402,6 +942,10 @@ def submenu_estadisticas(datos: list[dict[str, object]]) -> None:
         print("3) Promedio de superficie (km²)") # Opción para ver el promedio de superficie
         print("4) Cantidad de países por continente") # Opción para ver la cantidad de países por continente
         print("5) Mostrar TODO el resumen") # Opción para ver todas las estadísticas en un resumen
+        print("6) Mediana y percentiles (p90/p99) de población y densidad") # Opción para ver cuantiles
+        print("7) Histogramas de población y densidad") # Opción para ver distribución por décadas
+        print("8) Densidad promedio y por continente") # Opción para ver densidades
+        print("9) Agrupar (por continente o tramos) con agregaciones") # Opción para agrupamientos a medida
         print("0) Volver") # Opción para volver al menú principal
         op = input("Elija una opción: ").strip() # Solicita al usuario que elija una opción
         if op == "0": # Si el usuario elige la opción 0
@@ -443,11 +987,24 @@ def submenu_estadisticas(datos: list[dict[str, object]]) -> None:
         elif op == "5": # Si el usuario elige la opción 5
             mostrar_estadisticas_resumen(datos) # Muestra todas las estadísticas en un resumen
 
+        elif op in {"6", "7", "8"}: # Estadísticas de distribución (una sola pasada sobre los datos)
+            dist = estadisticas_distribucion(datos) # Exacto si el dataset es chico, aproximado si no
+            if op == "6":
+                mostrar_percentiles(dist) # Muestra mediana, p90 y p99
+            elif op == "7":
+                mostrar_histograma("Países por población (habitantes)", dist["hist_poblacion"]) # Histograma de población
+                mostrar_histograma("Países por densidad (hab/km²)", dist["hist_densidad"]) # Histograma de densidad
+            else:
+                mostrar_densidades(dist) # Muestra densidad promedio y por continente
+
+        elif op == "9": # Si el usuario elige la opción 9
+            submenu_agrupar(datos) # Pide claves y agregaciones y muestra el resultado
+
         else: # Si el usuario ingresa una opción inválida
             print("[ERROR] Opción inválida. Intente nuevamente.") # Informa al usuario que la opción es inválida
 #==========================================================#
 #======Sub menú para Ordenamientos (Iteración 2)===========# 
-def submenu_ordenamientos(datos: list[dict[str, object]]) -> None:
+def submenu_ordenamientos(datos: list[dict[str, object]], ruta_actual: str | None = None, sesion: dict[str, object] | None = None) -> None:
     if not datos: # Verifica si hay datos cargados
         print("[INFO] No hay datos cargados. Use la opción 1 del menú principal.") # Informa al usuario que no hay datos cargados
         return # Sale de la función
@@ -469,22 +1026,25 @@ def submenu_ordenamientos(datos: list[dict[str, object]]) -> None:
 
         # mapear opción a campo
         campo = {"1": "nombre", "2": "poblacion", "3": "superficie"}[op]  # campo a ordenar
+        if campo == "nombre" and isinstance(datos, CSVMapeado): # Habría que cargar todos los nombres en memoria
+            print("[INFO] Modo fuera de memoria: ordenar por nombre no está disponible. Ordene por población o superficie, o cargue el CSV en modo normal.")
+            continue
 
         sentido = input("Orden (A = ascendente, D = descendente) [A/D]: ").strip().lower() # Solicita el sentido del ordenamiento
         descendente = True if sentido == "d" else False  # default ascendente
 
-        ordenados = ordenar_paises(datos, campo, descendente) # Ordena los dict[str, object]s según el campo y el sentido especificados
+        ordenados = ordenar_paises(datos, campo, descendente, sesion) # Ordena los dict[str, object]s según el campo y el sentido especificados
 
         # Mostrar resultados (limitar para no inundar la consola)
         print(f"[OK] Mostrando primeros resultados ordenados por {campo} ({'desc' if descendente else 'asc'}):") # Informa el criterio de ordenamiento
         limite = 50 # Limita la cantidad de resultados a mostrar
-        for r in ordenados[:limite]: # Itera sobre los primeros resultados ordenados
-            mostrar_registro(r) # Muestra cada dict[str, object] ordenado
+        mostrar_registros(ordenados[:limite]) # Muestra los primeros resultados ordenados de una vez
         if len(ordenados) > limite: # Si hay más resultados que el límite
             print(f"[INFO] Mostrando {limite} de {len(ordenados)}. Refine con filtros o cambie el orden.") # Informa que solo se muestran los primeros resultados
+        ofrecer_salida(ordenados, limite, ruta_actual) # Permite verlos como tabla o exportar el listado completo
 #==========================================================#
 #======Sub menú para Filtrado Avanzado (Iteración 2)=======#
-def submenu_filtros(datos: list[dict[str, object]]) -> None:
+def submenu_filtros(datos: list[dict[str, object]], ruta_actual: str | None = None, sesion: dict[str, object] | None = None) -> None:
     if not datos: # Verifica si hay datos cargados
         print("[INFO] No hay datos cargados. Use la opción 1 del menú principal.")
         return
@@ -498,14 +1058,14 @@ def submenu_filtros(datos: list[dict[str, object]]) -> None:
         op = input("Elija una opción: ").strip() # Solicita al usuario que elija una opción
 
         if op == "1": # Si el usuario elige la opción 1
-            cont =elegir_continente(datos).strip() # Solicita el continente a filtrar
-            res = filtrar_por_continente(datos, cont) # Filtra los dict[str, object]s por continente
+            cont =elegir_continente(datos, sesion).strip() # Solicita el continente a filtrar
+            res = filtrar_por_continente(datos, cont, sesion) # Filtra los dict[str, object]s por continente
             if res: # Si se encontraron resultados
                 print(f"[OK] {len(res)} resultado(s):") # Informa la cantidad de resultados encontrados
-                for r in res[:50]:  # Limitar impresión por consola
-                    mostrar_registro(r) # Muestra cada dict[str, object] encontrado
+                mostrar_registros(res[:50])  # Limitar impresión por consola
                 if len(res) > 50: # Si hay más de 50 resultados
                     print(f"[INFO] Mostrando 50 de {len(res)}. Refine el filtro para ver menos.") # Informa que solo se muestran los primeros 50 resultados
+                ofrecer_salida(res, ruta_actual=ruta_actual) # Permite verlos como tabla o exportar el resultado completo
             else: # Si no se encontraron resultados
                 print("[INFO] Sin resultados para ese continente.") # Informa al usuario que no se encontraron resultados
 
@@ -515,13 +1075,13 @@ def submenu_filtros(datos: list[dict[str, object]]) -> None:
             if not rango: # Si el rango no es válido
                 print("[ERROR] Formato de rango inválido.") # Informa al usuario que el formato es inválido
                 continue # Vuelve al inicio del bucle
-            res = filtrar_por_poblacion(datos, rango) # Filtra los dict[str, object]s por rango de población
+            res = filtrar_por_poblacion(datos, rango, sesion) # Filtra los dict[str, object]s por rango de población
             if res: # Si se encontraron resultados
                 print(f"[OK] {len(res)} resultado(s):") # Informa la cantidad de resultados encontrados
-                for r in res[:50]: # Limitar impresión por consola
-                    mostrar_registro(r) # Muestra cada dict[str, object] encontrado
+                mostrar_registros(res[:50]) # Limitar impresión por consola
                 if len(res) > 50: # Si hay más de 50 resultados
                     print(f"[INFO] Mostrando 50 de {len(res)}. Refine el filtro para ver menos.") # Informa que solo se muestran los primeros 50 resultados
+                ofrecer_salida(res, ruta_actual=ruta_actual) # Permite verlos como tabla o exportar el resultado completo
             else: # Si no se encontraron resultados
                 print("[INFO] Sin resultados para ese rango de población.") # Informa al usuario que no se encontraron resultados
 
@@ -531,13 +1091,13 @@ def submenu_filtros(datos: list[dict[str, object]]) -> None:
             if not rango: # Si el rango no es válido
                 print("[ERROR] Formato de rango inválido.") # Informa al usuario que el formato es inválido
                 continue # Vuelve al inicio del bucle
-            res = filtrar_por_superficie(datos, rango) # Filtra los dict[str, object]s por rango de superficie
+            res = filtrar_por_superficie(datos, rango, sesion) # Filtra los dict[str, object]s por rango de superficie
             if res: # Si se encontraron resultados
                 print(f"[OK] {len(res)} resultado(s):") # Informa la cantidad de resultados encontrados
-                for r in res[:50]: # Limitar impresión por consola
-                    mostrar_registro(r) # Muestra cada dict[str, object] encontrado
+                mostrar_registros(res[:50]) # Limitar impresión por consola
                 if len(res) > 50: # Si hay más de 50 resultados
                     print(f"[INFO] Mostrando 50 de {len(res)}. Refine el filtro para ver menos.") # Informa que solo se muestran los primeros 50 resultados
+                ofrecer_salida(res, ruta_actual=ruta_actual) # Permite verlos como tabla o exportar el resultado completo
             else: # Si no se encontraron resultados
                 print("[INFO] Sin resultados para ese rango de superficie.") # Informa al usuario que no se encontraron resultados
 
@@ -559,16 +1119,26 @@ def submenu_filtros(datos: list[dict[str, object]]) -> None:
 
 #================# Función filtrar_por_continente =================#
 #==filtra por igualdad de continente (case-insensitive, tolerando espacios)==#
-def filtrar_por_continente(datos: list[dict[str, object]], continente: str) -> list[dict[str, object]]: 
+def filtrar_por_continente(datos: list[dict[str, object]], continente: str, sesion: dict[str, object] | None = None) -> list[dict[str, object]]:
     q = (continente or "").strip().lower() # Normaliza el continente para comparación
+    return consultar_con_cache(sesion, ("continente", q), lambda: _filtrar_por_continente(datos, q)) # Reutiliza el resultado si ya se consultó
+
+def _filtrar_por_continente(datos: list[dict[str, object]], q: str) -> list[dict[str, object]]:
     if not q: # Si el continente está vacío, devuelve una lista vacía
         return [] 
+    if isinstance(datos, CSVMapeado): # Modo fuera de memoria: filtra sobre los códigos de continente
+        return datos.filtrar_continente(q)
     return [r for r in datos if (str(r["continente"]).strip().lower() == q)] # Filtra los dict[str, object]s por continente
 #=================================================================#
 
 #================# Función filtrar_por_poblacion =================#
 #==filtra por rango de población (min, max) donde min o max pueden ser None==#
-def filtrar_por_poblacion(datos: list[dict[str, object]], rango: tuple[int | None, int | None]) -> list[dict[str, object]]:
+def filtrar_por_poblacion(datos: list[dict[str, object]], rango: tuple[int | None, int | None], sesion: dict[str, object] | None = None) -> list[dict[str, object]]:
+    return consultar_con_cache(sesion, ("poblacion", tuple(rango)), lambda: _filtrar_por_poblacion(datos, rango)) # Reutiliza el resultado si ya se consultó
+
+def _filtrar_por_poblacion(datos: list[dict[str, object]], rango: tuple[int | None, int | None]) -> list[dict[str, object]]:
+    if isinstance(datos, CSVMapeado): # Modo fuera de memoria: filtra sobre la columna compacta
+        return datos.filtrar_rango("poblacion", rango)
     mn, mx = rango # Desempaqueta el rango en min y max
     res: list[dict[str, object]] = [] # Lista para almacenar los dict[str, object]s que cumplen el criterio
     for r in datos: # Itera sobre cada dict[str, object] en los datos
@@ -583,7 +1153,12 @@ def filtrar_por_poblacion(datos: list[dict[str, object]], rango: tuple[int | Non
 
 #================# Función filtrar_por_superficie =================#
 #==filtra por rango de superficie (min, max) donde min o max pueden ser None==#
-def filtrar_por_superficie(datos: list[dict[str, object]], rango: tuple[int | None, int | None]) -> list[dict[str, object]]:
+def filtrar_por_superficie(datos: list[dict[str, object]], rango: tuple[int | None, int | None], sesion: dict[str, object] | None = None) -> list[dict[str, object]]:
+    return consultar_con_cache(sesion, ("superficie", tuple(rango)), lambda: _filtrar_por_superficie(datos, rango)) # Reutiliza el resultado si ya se consultó
+
+def _filtrar_por_superficie(datos: list[dict[str, object]], rango: tuple[int | None, int | None]) -> list[dict[str, object]]:
+    if isinstance(datos, CSVMapeado): # Modo fuera de memoria: filtra sobre la columna compacta
+        return datos.filtrar_rango("superficie", rango)
     mn, mx = rango # Desempaqueta el rango en min y max
     res: list[dict[str, object]] = [] # Lista para almacenar los dict[str, object]s que cumplen el criterio
     for r in datos: # Itera sobre cada dict[str, object] en los datos
@@ -599,14 +1174,22 @@ def filtrar_por_superficie(datos: list[dict[str, object]], rango: tuple[int | No
 #================# Función ordenar_paises =================#
 #     Ordena y devuelve una NUEVA lista, no modifica el original.
 #==========================================================#
-def ordenar_paises(datos: list[dict[str, object]], campo: str, descendente: bool = False) -> list[dict[str, object]]:
+def ordenar_paises(datos: list[dict[str, object]], campo: str, descendente: bool = False, sesion: dict[str, object] | None = None) -> list[dict[str, object]]:
     """
     Devuelve una NUEVA lista ordenada por 'campo' si es válido.
     Campos válidos: nombre, poblacion, superficie.
+    En modo fuera de memoria (CSVMapeado) ordenar por nombre devuelve [].
     """
     if campo not in campos_orden_validos():
         print(f"[ERROR] Campo de orden no válido. Use uno de: {list(campos_orden_validos())}")
         return []
+    if campo == "nombre" and isinstance(datos, CSVMapeado):
+        return []
+    return consultar_con_cache(sesion, ("orden", campo, bool(descendente)), lambda: _ordenar_paises(datos, campo, descendente))
+
+def _ordenar_paises(datos: list[dict[str, object]], campo: str, descendente: bool) -> list[dict[str, object]]:
+    if isinstance(datos, CSVMapeado): # Modo fuera de memoria: ordena índices de fila, no registros
+        return datos.ordenar(campo, descendente)
     # Claves robustas por tipo
     def _clave(reg: dict[str, object]):
         if campo == "nombre":
@@ -654,6 +1237,11 @@ def parsear_rango_num(texto: str) -> tuple[int | None, int | None] | None:
 def pais_mayor_menor_poblacion(datos: list[dict[str, object]]) -> tuple[dict[str, object] | None, dict[str, object] | None]:
     if not datos: # Si no hay datos,
         return None, None # devuelve (None, None)
+    if isinstance(datos, CSVMapeado): # Modo fuera de memoria: busca sobre la columna compacta
+        col = datos.columna("poblacion")
+        i_mayor = max(range(len(col)), key=col.__getitem__)
+        i_menor = min(range(len(col)), key=col.__getitem__)
+        return datos[i_mayor], datos[i_menor]
     mayor = max(datos, key=lambda r: int(r["poblacion"])) # Encuentra el país con mayor población
     menor = min(datos, key=lambda r: int(r["poblacion"])) # Encuentra el país con menor población
     return mayor, menor  # Devuelve una tupla con el país de mayor y menor población
@@ -664,6 +1252,8 @@ def pais_mayor_menor_poblacion(datos: list[dict[str, object]]) -> tuple[dict[str
 def promedio_poblacion(datos: list[dict[str, object]]) -> float | None:
     if not datos: # Si no hay datos,
         return None # devuelve None
+    if isinstance(datos, CSVMapeado): # Modo fuera de memoria: suma sobre la columna compacta
+        return sum(datos.columna("poblacion")) / len(datos)
     return sum(int(r["poblacion"]) for r in datos) / len(datos) # Calcula y devuelve el promedio de población
 #===================================================================#
 
@@ -672,12 +1262,16 @@ def promedio_poblacion(datos: list[dict[str, object]]) -> float | None:
 def promedio_superficie(datos: list[dict[str, object]]) -> float | None:
     if not datos: # Si no hay datos, devuelve None
         return None # Devuelve None si no hay datos
+    if isinstance(datos, CSVMapeado): # Modo fuera de memoria: suma sobre la columna compacta
+        return sum(datos.columna("superficie")) / len(datos)
     return sum(int(r["superficie"]) for r in datos) / len(datos) # Calcula y devuelve el promedio de superficie
 #=================================================================#
 
 #================# Función conteo_por_continente =================#
 #==Cantidad de países por continente (case-sensitive tal como vienen cargados).==#
 def conteo_por_continente(datos: list[dict[str, object]]) -> dict[str, int]:
+    if isinstance(datos, CSVMapeado): # Modo fuera de memoria: cuenta códigos de continente
+        return datos.conteo_continentes()
     conteo: dict[str, int] = {} # Diccionario para almacenar el conteo por continente
     for r in datos: # Itera sobre cada dict[str, object] en los datos
         cont = str(r["continente"]) # Obtiene el continente del dict[str, object]
@@ -685,6 +1279,439 @@ def conteo_por_continente(datos: list[dict[str, object]]) -> dict[str, int]:
     return conteo # Devuelve el diccionario con el conteo por continente
 #=================================================================#
 
+#=========================#
+#  Distribución: cuantiles e histogramas en una sola pasada
+#  - Modo exacto (listas ordenadas) para datasets chicos
+#  - Modo aproximado con un sketch KLL combinable entre bloques
+#=========================#
+KLL_K = 200            # tamaño del sketch: error de rango ~1,7% (99% de confianza), proporcional a 1/k
+UMBRAL_EXACTO = 100_000  # hasta esta cantidad de registros se calculan cuantiles exactos
+BLOQUE_ESTADISTICAS = 50_000  # registros por bloque; cada bloque se resume y se combina
+
+
+#==Sketch KLL: niveles de muestras; cada muestra del nivel h "pesa" 2**h==#
+def _kll_nuevo(k: int = KLL_K, azar: random.Random | None = None) -> dict[str, object]:
+    # azar: generador de las monedas de compactación; los sketches de un mismo
+    # cálculo comparten uno (o cada uno tiene el suyo) para que sean independientes
+    return {"k": k, "n": 0, "tam": 0, "niveles": [[]], "capacidad": _kll_capacidad_total(k, 1),
+            "azar": azar if azar is not None else random.Random()}
+
+
+def _kll_capacidad(k: int, h: int, alto: int) -> int:
+    # los niveles bajos se achican geométricamente (factor 2/3)
+    return max(2, int(k * (2 / 3) ** (alto - 1 - h)))
+
+
+def _kll_capacidad_total(k: int, alto: int) -> int:
+    return sum(_kll_capacidad(k, h, alto) for h in range(alto))
+
+
+def _kll_agregar(sk: dict[str, object], v: float) -> None:
+    sk["niveles"][0].append(v)
+    sk["n"] += 1
+    sk["tam"] += 1
+    if sk["tam"] >= sk["capacidad"]:
+        _kll_compactar(sk)
+
+
+def _kll_compactar(sk: dict[str, object]) -> None:
+    """Compacta niveles llenos (ordena y conserva uno de cada dos) hasta volver a la capacidad."""
+    niveles = sk["niveles"]
+    while sk["tam"] >= sk["capacidad"]:
+        alto = len(niveles)
+        for h in range(alto):
+            if len(niveles[h]) >= _kll_capacidad(sk["k"], h, alto):
+                if h + 1 == len(niveles):
+                    niveles.append([])
+                    sk["capacidad"] = _kll_capacidad_total(sk["k"], len(niveles))
+                nivel = sorted(niveles[h])
+                resto = [nivel.pop()] if len(nivel) % 2 == 1 else []
+                promovidos = nivel[sk["azar"].randint(0, 1)::2]
+                niveles[h + 1].extend(promovidos)
+                niveles[h] = resto
+                sk["tam"] -= len(nivel) - len(promovidos)
+                break
+        else:
+            return
+
+
+def _kll_combinar(a: dict[str, object], b: dict[str, object]) -> dict[str, object]:
+    """Nuevo sketch equivalente a haber visto los valores de a y de b."""
+    res = _kll_nuevo(a["k"], a["azar"])
+    alto = max(len(a["niveles"]), len(b["niveles"]))
+    res["niveles"] = [[] for _ in range(alto)]
+    for sk in (a, b):
+        for h, nivel in enumerate(sk["niveles"]):
+            res["niveles"][h].extend(nivel)
+    res["n"] = a["n"] + b["n"]
+    res["tam"] = a["tam"] + b["tam"]
+    res["capacidad"] = _kll_capacidad_total(res["k"], alto)
+    _kll_compactar(res)
+    return res
+
+
+def _kll_cuantiles(sk: dict[str, object], qs: list[float]) -> list[float | None]:
+    pares = sorted((v, 1 << h) for h, nivel in enumerate(sk["niveles"]) for v in nivel)
+    total = sum(p for _, p in pares)
+    res: list[float | None] = []
+    for q in qs:
+        if total == 0:
+            res.append(None)
+            continue
+        objetivo = max(1, math.ceil(q * total))
+        acum = 0
+        for v, p in pares:
+            acum += p
+            if acum >= objetivo:
+                res.append(v)
+                break
+    return res
+
+
+def _cuantiles_exactos(valores: list[float], qs: list[float]) -> list[float | None]:
+    # rango más cercano: el menor valor con al menos q*n valores <= él
+    orden = sorted(valores)
+    n = len(orden)
+    return [orden[max(1, math.ceil(q * n)) - 1] if n else None for q in qs]
+
+
+#==Histograma logarítmico: cantidad de valores por década (10^e <= v < 10^(e+1)); -1 = menores a 1==#
+def _decada(v: float) -> int:
+    if v < 1:
+        return -1
+    e = len(str(int(v))) - 1  # sin log10: evita errores de redondeo en potencias exactas
+    return e
+
+
+def _iterar_numericos(datos: list[dict[str, object]]):
+    """(poblacion, superficie, continente) de cada registro sin armar dicts si no hace falta."""
+    if isinstance(datos, CSVMapeado):
+        return datos.filas_numericas()
+    return ((int(r["poblacion"]), int(r["superficie"]), str(r["continente"])) for r in datos)
+
+
+def _distribucion_nueva(exacto: bool, azar: random.Random | None = None) -> dict[str, object]:
+    return {
+        "exacto": exacto,
+        "n": 0,
+        "poblacion": [] if exacto else _kll_nuevo(azar=azar),
+        "densidad": [] if exacto else _kll_nuevo(azar=azar),
+        "hist_poblacion": {},
+        "hist_densidad": {},
+        "suma_densidad": 0.0,
+        "por_continente": {},  # continente -> [países, suma población, suma superficie, suma densidades]
+    }
+
+
+def _distribucion_agregar(dist: dict[str, object], poblacion: int, superficie: int, continente: str) -> None:
+    densidad = poblacion / superficie
+    dist["n"] += 1
+    if dist["exacto"]:
+        dist["poblacion"].append(poblacion)
+        dist["densidad"].append(densidad)
+    else:
+        _kll_agregar(dist["poblacion"], poblacion)
+        _kll_agregar(dist["densidad"], densidad)
+    for clave, v in (("hist_poblacion", poblacion), ("hist_densidad", densidad)):
+        e = _decada(v)
+        dist[clave][e] = dist[clave].get(e, 0) + 1
+    dist["suma_densidad"] += densidad
+    acum = dist["por_continente"].setdefault(continente, [0, 0, 0, 0.0])
+    acum[0] += 1
+    acum[1] += poblacion
+    acum[2] += superficie
+    acum[3] += densidad
+
+
+#================# Función combinar_distribuciones =================#
+#==Une dos resúmenes (por ejemplo de bloques o archivos distintos)==#
+def combinar_distribuciones(a: dict[str, object], b: dict[str, object]) -> dict[str, object]:
+    exacto = a["exacto"] and b["exacto"]
+    res = _distribucion_nueva(exacto)
+    res["n"] = a["n"] + b["n"]
+    for clave in ("poblacion", "densidad"):
+        if exacto:
+            res[clave] = a[clave] + b[clave]
+        else:
+            # un resumen exacto se convierte a sketch antes de combinar
+            sks = []
+            for d in (a, b):
+                if d["exacto"]:
+                    sk = _kll_nuevo()
+                    for v in d[clave]:
+                        _kll_agregar(sk, v)
+                    sks.append(sk)
+                else:
+                    sks.append(d[clave])
+            res[clave] = _kll_combinar(sks[0], sks[1])
+    for clave in ("hist_poblacion", "hist_densidad"):
+        for d in (a, b):
+            for e, cant in d[clave].items():
+                res[clave][e] = res[clave].get(e, 0) + cant
+    res["suma_densidad"] = a["suma_densidad"] + b["suma_densidad"]
+    for d in (a, b):
+        for cont, acum in d["por_continente"].items():
+            destino = res["por_continente"].setdefault(cont, [0, 0, 0, 0.0])
+            for i in range(4):
+                destino[i] += acum[i]
+    return res
+
+
+#================# Función estadisticas_distribucion =================#
+#==Mediana, percentiles, histogramas y densidades en una sola pasada==#
+def estadisticas_distribucion(datos: list[dict[str, object]], exacto: bool | None = None) -> dict[str, object]:
+    """
+    Recorre los datos una vez, por bloques de BLOQUE_ESTADISTICAS registros, y
+    combina el resumen de cada bloque. exacto=None elige modo exacto si hay
+    hasta UMBRAL_EXACTO registros. En modo aproximado los percentiles tienen
+    un error de rango de ~1,7% con KLL_K=200 (el valor devuelto está entre los
+    percentiles q-0,017 y q+0,017 reales con 99% de confianza).
+    """
+    if exacto is None:
+        exacto = len(datos) <= UMBRAL_EXACTO
+    azar = random.Random()  # un solo generador para todos los sketches de este cálculo
+    total = _distribucion_nueva(exacto, azar)
+    bloque = _distribucion_nueva(exacto, azar)
+    for pob, sup, cont in _iterar_numericos(datos):
+        _distribucion_agregar(bloque, pob, sup, cont)
+        if bloque["n"] >= BLOQUE_ESTADISTICAS:
+            total = combinar_distribuciones(total, bloque)
+            bloque = _distribucion_nueva(exacto, azar)
+    if bloque["n"] > 0:
+        total = combinar_distribuciones(total, bloque)
+    return total
+
+
+def percentiles(dist: dict[str, object], campo: str, qs: list[float]) -> list[float | None]:
+    """Percentiles de 'poblacion' o 'densidad' (qs entre 0 y 1)."""
+    if dist["exacto"]:
+        return _cuantiles_exactos(dist[campo], qs)
+    return _kll_cuantiles(dist[campo], qs)
+
+
+#================# Función densidad_promedio =================#
+#==Promedio de poblacion/superficie por país. None si no hay datos.==#
+def densidad_promedio(datos: list[dict[str, object]]) -> float | None:
+    if not datos:
+        return None
+    return sum(p / s for p, s, _ in _iterar_numericos(datos)) / len(datos)
+
+
+#==Texto del rango de una década del histograma==#
+def _etiqueta_decada(e: int) -> str:
+    if e < 0:
+        return "< 1"
+    return f"{10 ** e:,} – {10 ** (e + 1) - 1:,}".replace(",", ".")
+
+
+def mostrar_histograma(titulo: str, hist: dict[int, int]) -> None:
+    print(f"[OK] {titulo}:")
+    if not hist:
+        print("[INFO] No hay datos suficientes.")
+        return
+    mayor = max(hist.values())
+    ancho = max(len(_etiqueta_decada(e)) for e in hist)
+    for e in range(min(hist), max(hist) + 1):
+        cant = hist.get(e, 0)
+        barra = "#" * (round(40 * cant / mayor) if cant else 0)
+        print(f"  {_etiqueta_decada(e):>{ancho}} | {barra} {cant}")
+
+
+def mostrar_percentiles(dist: dict[str, object]) -> None:
+    modo = "exacto" if dist["exacto"] else f"aproximado, error de rango ~{1.7 * 200 / KLL_K:.1f}%"
+    print(f"[OK] Percentiles ({modo}):")
+    for campo, unidad, decimales in (("poblacion", "hab.", 0), ("densidad", "hab/km²", 2)):
+        p50, p90, p99 = percentiles(dist, campo, [0.5, 0.9, 0.99])
+        if p50 is None:
+            print("[INFO] No hay datos suficientes.")
+            return
+        print(f"- {campo.capitalize()}: mediana {p50:,.{decimales}f} | p90 {p90:,.{decimales}f} | "
+              f"p99 {p99:,.{decimales}f} {unidad}".replace(",", "."))
+
+
+def mostrar_densidades(dist: dict[str, object]) -> None:
+    if dist["n"] == 0:
+        print("[INFO] No hay datos suficientes.")
+        return
+    print(f"[OK] Densidad promedio: {dist['suma_densidad'] / dist['n']:,.2f} hab/km²".replace(",", "."))
+    print("[OK] Densidad por continente (promedio por país | total = población / superficie):")
+    for cont, (n, pob, sup, suma_dens) in dist["por_continente"].items():
+        print(f"- {cont}: {suma_dens / n:,.2f} | {pob / sup:,.2f} hab/km²".replace(",", "."))
+
+
+#=========================#
+#  Agrupamientos (group-by) en una sola pasada
+#  - Claves: "continente", "<campo>/<ancho>" (tramos fijos) o "<campo>/log" (décadas)
+#  - Agregaciones: "count", "sum|avg|min|max:<campo>" y "densidad" (Σ población / Σ superficie)
+#  - Campos numéricos: poblacion, superficie y densidad (poblacion/superficie por país)
+#=========================#
+def campos_agrupables() -> tuple[str, ...]:
+    return ("poblacion", "superficie", "densidad")
+
+
+def funciones_agregacion() -> tuple[str, ...]:
+    return ("count", "sum", "avg", "min", "max", "densidad")
+
+
+#================# Función parsear_clave_grupo =================#
+#==Devuelve ("continente",), (campo, "ancho", n) o (campo, "log"); None si es inválida==#
+def parsear_clave_grupo(texto: str) -> tuple | None:
+    s = (texto or "").strip().lower()
+    if s == "continente":
+        return ("continente",)
+    if "/" not in s:
+        return None
+    campo, tramo = s.split("/", 1)
+    campo = campo.strip()
+    tramo = tramo.strip()
+    if campo not in campos_agrupables():
+        return None
+    if tramo == "log":
+        return (campo, "log")
+    ok, ancho = _entero_sin_sep(tramo)
+    if not ok or ancho <= 0:
+        return None
+    return (campo, "ancho", ancho)
+
+
+#================# Función parsear_agregacion =================#
+#==Devuelve (funcion,) o (funcion, campo); None si es inválida==#
+def parsear_agregacion(texto: str) -> tuple | None:
+    s = (texto or "").strip().lower()
+    if s in ("count", "densidad"):
+        return (s,)
+    if ":" not in s:
+        return None
+    fn, campo = (p.strip() for p in s.split(":", 1))
+    if fn not in ("sum", "avg", "min", "max") or campo not in campos_agrupables():
+        return None
+    return (fn, campo)
+
+
+def _nombre_agregacion(agg: tuple) -> str:
+    return ":".join(str(p) for p in agg)
+
+
+def _nombre_clave(clave: tuple) -> str:
+    # texto completo de la clave (ej. "densidad/log"): no choca con otra clave del mismo campo ni con una agregación
+    if clave[0] == "continente":
+        return "continente"
+    return f"{clave[0]}/{clave[1] if clave[1] == 'log' else clave[2]}"
+
+
+def _valor_clave(clave: tuple, pob: int, sup: int, cont: str) -> tuple[object, str]:
+    """(valor para ordenar, texto a mostrar) del grupo al que pertenece un registro."""
+    if clave[0] == "continente":
+        return (cont, cont)
+    v = {"poblacion": pob, "superficie": sup, "densidad": pob / sup}[clave[0]]
+    if clave[1] == "log":
+        e = _decada(v)
+        return (e, _etiqueta_decada(e))
+    ancho = clave[2]
+    desde = int(v // ancho) * ancho
+    return (desde, f"{desde}-{desde + ancho - 1}" if isinstance(v, int) else f"{desde}-{desde + ancho}")
+
+
+#================# Función agrupar =================#
+#==Calcula todas las agregaciones de todos los grupos en una sola pasada==#
+def agrupar(datos: list[dict[str, object]], claves: list[tuple], agregaciones: list[tuple]) -> list[dict[str, object]]:
+    """
+    Devuelve una fila (dict) por grupo, ordenadas por clave, con un campo por
+    clave de grupo (nombre = texto de la clave, ej. "poblacion/log") y uno por
+    agregación (nombre = texto de la agregación, ej. "avg:poblacion").
+    Con claves=[] devuelve un único grupo con el total.
+    """
+    grupos: dict[tuple, list] = {}   # valores de clave -> acumuladores (uno por agregación)
+    etiquetas: dict[tuple, list[str]] = {}
+    for pob, sup, cont in _iterar_numericos(datos):
+        pares = [_valor_clave(c, pob, sup, cont) for c in claves]
+        k = tuple(p[0] for p in pares)
+        acums = grupos.get(k)
+        if acums is None:
+            acums = [[0, 0] if a[0] in ("avg", "densidad") else None for a in agregaciones]
+            grupos[k] = acums
+            etiquetas[k] = [p[1] for p in pares]
+        valores = {"poblacion": pob, "superficie": sup, "densidad": pob / sup}
+        for i, a in enumerate(agregaciones):
+            fn = a[0]
+            if fn == "count":
+                acums[i] = (acums[i] or 0) + 1
+            elif fn == "densidad":
+                acums[i][0] += pob
+                acums[i][1] += sup
+            elif fn == "avg":
+                acums[i][0] += valores[a[1]]
+                acums[i][1] += 1
+            elif fn == "sum":
+                acums[i] = (acums[i] or 0) + valores[a[1]]
+            elif fn == "min":
+                v = valores[a[1]]
+                acums[i] = v if acums[i] is None or v < acums[i] else acums[i]
+            else:  # max
+                v = valores[a[1]]
+                acums[i] = v if acums[i] is None or v > acums[i] else acums[i]
+
+    filas: list[dict[str, object]] = []
+    for k in sorted(grupos, key=lambda t: tuple(str(x).casefold() if isinstance(x, str) else x for x in t)):
+        fila: dict[str, object] = {}
+        for c, etiqueta in zip(claves, etiquetas[k]):
+            fila[_nombre_clave(c)] = etiqueta
+        for a, acum in zip(agregaciones, grupos[k]):
+            if a[0] in ("avg", "densidad"):
+                acum = acum[0] / acum[1] if acum[1] else None
+            fila[_nombre_agregacion(a)] = acum
+        filas.append(fila)
+    return filas
+
+
+#================# Función agrupar_json =================#
+def agrupar_json(filas: list[dict[str, object]]) -> str:
+    return json.dumps(filas, ensure_ascii=False, indent=2)
+
+
+def mostrar_agrupamiento(filas: list[dict[str, object]]) -> None:
+    if not filas:
+        print("[INFO] No hay datos suficientes.")
+        return
+    print(f"[OK] {len(filas)} grupo(s):")
+    for fila in filas:
+        partes = []
+        for campo, v in fila.items():
+            if isinstance(v, float):
+                v = f"{v:,.2f}".replace(",", ".")
+            elif isinstance(v, int):
+                v = f"{v:,}".replace(",", ".")
+            partes.append(f"{campo}: {v}")
+        print("- " + " | ".join(partes))
+
+
+def submenu_agrupar(datos: list[dict[str, object]]) -> None:
+    txt = input("Agrupar por (ej: continente, poblacion/10000000, densidad/log; Enter = total): ").strip()
+    claves = [parsear_clave_grupo(t) for t in txt.split(",")] if txt else []
+    if any(c is None for c in claves):
+        print("[ERROR] Clave de grupo inválida. Use continente, <campo>/<ancho> o <campo>/log "
+              f"con campo en {list(campos_agrupables())}.")
+        return
+    if len(set(claves)) != len(claves):
+        print("[ERROR] Claves de grupo repetidas.")
+        return
+    txt = input("Agregaciones (ej: count, sum:poblacion, avg:densidad, densidad): ").strip()
+    agregaciones = [parsear_agregacion(t) for t in txt.split(",")] if txt else []
+    if not agregaciones or any(a is None for a in agregaciones):
+        print(f"[ERROR] Agregación inválida. Use count, densidad o <funcion>:<campo> con funcion en "
+              f"{list(funciones_agregacion()[1:5])}.")
+        return
+    if len(set(agregaciones)) != len(agregaciones):
+        print("[ERROR] Agregaciones repetidas.")
+        return
+    filas = agrupar(datos, claves, agregaciones)
+    formato = input("Formato (T = tabla, J = JSON) [T/J]: ").strip().lower()
+    if formato == "j":
+        print(agrupar_json(filas))
+    else:
+        mostrar_agrupamiento(filas)
+
+
 #================# Función mostrar_estadisticas_resumen =================#
 #==Muestra todas las estadísticas pedidas por el TPI en un bloque compacto.==
 def mostrar_estadisticas_resumen(datos: list[dict[str, object]]) -> None:
@@ -705,6 +1732,7 @@ def mostrar_estadisticas_resumen(datos: list[dict[str, object]]) -> None:
         mostrar_registro(menor) # Muestra el país con menor población
     print(f"• Promedio de población: {prom_pob:,.2f}".replace(",", ".")) # Mostrar promedio de población
     print(f"• Promedio de superficie (km²): {prom_sup:,.2f}".replace(",", ".")) # Mostrar promedio de superficie
+    print(f"• Densidad promedio (hab/km²): {densidad_promedio(datos):,.2f}".replace(",", ".")) # Mostrar densidad promedio
     print("• Cantidad de países por continente:") # Mostrar cantidad de países por continente
     for cont, cant in conteo.items(): # Itera sobre cada continente y su cantidad
         print(f"  - {cont}: {cant}") # Muestra el continente y la cantidad de países
@@ -715,24 +1743,605 @@ def mostrar_estadisticas_resumen(datos: list[dict[str, object]]) -> None:
 
 
 
+#=========================#
+#  Sesión: estado ligado al dataset cargado
+#  - Índices (BK-tree, tries, k-d tree), versión de los datos, caché de
+#    consultas, nombres con cambios sin guardar y vigilancia del CSV
+#  - menu() tiene una sola sesión y la pasa junto con 'datos'; al cargar
+#    otro CSV se reinicia todo junto con reiniciar_sesion
+#  - Sin sesión (sesion=None) las funciones calculan sin índices ni caché
+#=========================#
+CACHE_MAX_ENTRADAS = 128           # cantidad máxima de resultados guardados
+CACHE_MAX_BYTES = 32 * 1024 * 1024  # memoria aproximada máxima (sólo la estructura del resultado)
+
+
+def nueva_sesion() -> dict[str, object]:
+    return {
+        "indices": {},
+        "version": 0,
+        "cache": {
+            "entradas": OrderedDict(), "bytes": 0,
+            "max_entradas": CACHE_MAX_ENTRADAS, "max_bytes": CACHE_MAX_BYTES,
+            "aciertos": 0, "fallos": 0, "desalojos": 0, "invalidaciones": 0,
+        },
+        "editados": set(),  # nombres normalizados con altas o cambios locales sin guardar
+        "vigilancia": {"hilo": None},
+    }
+
+
+def reiniciar_sesion(sesion: dict[str, object]) -> None:
+    """Se cargó otro dataset: detiene la vigilancia y descarta índices, caché y cambios sin guardar."""
+    detener_vigilancia(sesion)
+    sesion["editados"] = set()
+    registrar_recarga(sesion=sesion)
+
+
+def _indices(sesion: dict[str, object] | None) -> dict[str, object]:
+    """Índices de la sesión (sin sesión, unos temporales que se descartan al terminar)."""
+    return sesion["indices"] if sesion is not None else {}
+
+
+def version_datos(sesion: dict[str, object] | None) -> int | None:
+    return sesion["version"] if sesion is not None else None
+
+
+def _nueva_version(sesion: dict[str, object]) -> None:
+    """Sube la versión de los datos y descarta en el momento el caché de la versión anterior."""
+    sesion["version"] += 1
+    cache = sesion["cache"]
+    if cache["entradas"]:
+        cache["invalidaciones"] += 1
+    cache["entradas"].clear()
+    cache["bytes"] = 0
+
+
+def registrar_recarga(datos: list[dict[str, object]] | None = None, sesion: dict[str, object] | None = None) -> None:
+    """Descarta todos los índices (se cargó de nuevo o se quitaron registros)."""
+    if sesion is None:
+        return
+    _nueva_version(sesion)
+    sesion["indices"] = {}
+
+
+def registrar_alta(datos: list[dict[str, object]], idx: int, local: bool = True,
+                   sesion: dict[str, object] | None = None) -> None:
+    """
+    Avisa a los índices ya construidos que se agregó datos[idx].
+    local=False cuando el alta viene del archivo en disco (no es un cambio sin guardar).
+    """
+    if sesion is None:
+        return
+    if local:
+        sesion["editados"].add(normalizar_busqueda(str(datos[idx].get("nombre", ""))))
+    _nueva_version(sesion)
+    ind = sesion["indices"]
+    if "bk" in ind:
+        _bk_sincronizar(datos, ind)
+    if "trie_nombres" in ind:
+        _trie_nombres(datos, ind)
+    if "trie_continentes" in ind:
+        _trie_continentes(datos, ind)
+
+
+def registrar_cambio(datos: list[dict[str, object]], idx: int, anterior: dict[str, object], local: bool = True,
+                     sesion: dict[str, object] | None = None) -> None:
+    """Avisa a los índices ya construidos que datos[idx] cambió (anterior = valores previos)."""
+    if sesion is None:
+        return
+    if local:
+        sesion["editados"].add(normalizar_busqueda(str(datos[idx].get("nombre", ""))))
+    _nueva_version(sesion)
+    ind = sesion["indices"]
+    r = datos[idx]
+    if "kd" in ind and idx < ind["kd"]["n"]:
+        ind["kd"]["sucios"].add(idx)  # se revisa aparte hasta la próxima reconstrucción
+    if (normalizar_busqueda(str(anterior.get("nombre", ""))) != normalizar_busqueda(str(r.get("nombre", "")))
+            or str(anterior.get("continente", "")).strip().lower() != str(r.get("continente", "")).strip().lower()):
+        # BK-tree y tries no admiten bajas: se reconstruyen si cambió la clave
+        for clave in ("bk", "trie_nombres", "trie_continentes"):
+            ind.pop(clave, None)
+        return
+    _trie_actualizar_poblacion(datos, ind, idx, anterior)
+
+
+#=========================#
+#  Caché de consultas (LRU)
+#  - Clave: consulta normalizada + versión del dataset
+#  - La versión sube con cada carga, alta, cambio o baja, y al cambiar
+#    la versión se descartan todas las entradas
+#=========================#
+def configurar_cache(sesion: dict[str, object], max_entradas: int | None = None, max_bytes: int | None = None) -> None:
+    """Cambia los límites del caché (0 entradas = desactivado) y desaloja lo que sobre."""
+    cache = sesion["cache"]
+    if max_entradas is not None and max_entradas >= 0:
+        cache["max_entradas"] = max_entradas
+    if max_bytes is not None and max_bytes >= 0:
+        cache["max_bytes"] = max_bytes
+    _cache_ajustar(cache)
+
+
+def _tamano_resultado(res) -> int:
+    # los registros son compartidos con el dataset: se cuenta la lista (o la selección de filas)
+    if isinstance(res, CSVMapeado):
+        return sys.getsizeof(res._sel) if res._sel is not None else 0
+    return sys.getsizeof(res)
+
+
+def _cache_ajustar(cache: dict[str, object]) -> None:
+    entradas = cache["entradas"]
+    while entradas and (len(entradas) > cache["max_entradas"] or cache["bytes"] > cache["max_bytes"]):
+        _, (_, tam) = entradas.popitem(last=False)  # la usada hace más tiempo
+        cache["bytes"] -= tam
+        cache["desalojos"] += 1
+
+
+#================# Función consultar_con_cache =================#
+#==Devuelve el resultado guardado para 'clave' o lo calcula y lo guarda==#
+def consultar_con_cache(sesion: dict[str, object] | None, clave: tuple, calcular):
+    if sesion is None:
+        return calcular()
+    cache = sesion["cache"]
+    entradas = cache["entradas"]
+    clave = (sesion["version"],) + clave
+    if clave in entradas:
+        entradas.move_to_end(clave)
+        cache["aciertos"] += 1
+        res = entradas[clave][0]
+    else:
+        cache["fallos"] += 1
+        res = calcular()
+        tam = _tamano_resultado(res)
+        if cache["max_entradas"] > 0 and tam <= cache["max_bytes"]:
+            entradas[clave] = (res, tam)
+            cache["bytes"] += tam
+            _cache_ajustar(cache)
+    # copia de la lista para que quien la reciba no altere lo guardado
+    return list(res) if isinstance(res, list) else res
+
+
+def estadisticas_cache(sesion: dict[str, object]) -> dict[str, int]:
+    cache = sesion["cache"]
+    return {c: int(cache[c]) for c in ("aciertos", "fallos", "desalojos", "invalidaciones", "bytes",
+                                       "max_entradas", "max_bytes")} | {"entradas": len(cache["entradas"])}
+
+
+def mostrar_estadisticas_cache(sesion: dict[str, object]) -> None:
+    e = estadisticas_cache(sesion)
+    print(f"[INFO] Caché de consultas: {e['entradas']}/{e['max_entradas']} entradas, "
+          f"{e['bytes'] / 1024:.1f}/{e['max_bytes'] / 1024:.0f} KB | aciertos: {e['aciertos']} | "
+          f"fallos: {e['fallos']} | desalojos: {e['desalojos']} | invalidaciones: {e['invalidaciones']}")
+
+
+#================# Función submenu_cache =================#
+#==Permite cambiar desde la consola los límites del caché (Enter conserva el valor)==#
+def submenu_cache(sesion: dict[str, object]) -> None:
+    mostrar_estadisticas_cache(sesion)
+    e = estadisticas_cache(sesion)
+    txt = input(f"Máximo de resultados guardados (0 = desactivado) [Enter = {e['max_entradas']}]: ").strip()
+    ok_ent, entradas = _entero_sin_sep(txt) if txt else (True, e["max_entradas"])
+    txt = input(f"Memoria máxima en MB [Enter = {e['max_bytes'] / (1024 * 1024):g}]: ").strip()
+    ok_mb, mb = _entero_sin_sep(txt) if txt else (True, -1)
+    if not ok_ent or entradas < 0 or not ok_mb or (txt and mb < 0):
+        print("[ERROR] Debe ingresar enteros mayores o iguales a 0.")
+        return
+    configurar_cache(sesion, entradas, mb * 1024 * 1024 if txt else None)
+    mostrar_estadisticas_cache(sesion)
+
+
+#=========================#
+#  Autocompletado (trie de prefijos con top-N por población)
+#  - Cada nodo guarda los K ids de mayor peso de su subárbol, así
+#    completar un prefijo cuesta O(largo del prefijo + N) para N <= K
+#=========================#
+TOP_AUTOCOMPLETAR = 10  # K: cantidad de sugerencias precalculadas por nodo
+
+#==Nodo del trie: [{letra: hijo} | None, ids que terminan acá | None, top K ids, ids en el subárbol]==#
+def _trie_nuevo(k: int = TOP_AUTOCOMPLETAR) -> dict[str, object]:
+    return {"raiz": [None, None, [], 0], "k": k, "pesos": {}}
+
+
+def _trie_camino(trie: dict[str, object], clave: str, crear: bool) -> list[list] | None:
+    """Nodos desde la raíz hasta el de 'clave' (None si no existe y crear=False)."""
+    nodo = trie["raiz"]
+    camino = [nodo]
+    for c in clave:
+        hijos = nodo[0]
+        if hijos is None:
+            if not crear:
+                return None
+            hijos = nodo[0] = {}
+        sig = hijos.get(c)
+        if sig is None:
+            if not crear:
+                return None
+            sig = hijos[c] = [None, None, [], 0]
+        nodo = sig
+        camino.append(nodo)
+    return camino
+
+
+def _trie_insertar(trie: dict[str, object], clave: str, ident: object, peso: int) -> None:
+    pesos = trie["pesos"]
+    pesos[ident] = peso
+    camino = _trie_camino(trie, clave, crear=True)
+    fin = camino[-1]
+    if fin[1] is None:
+        fin[1] = []
+    fin[1].append(ident)
+    # Una alta sólo puede entrar a los top existentes (nunca saca a nadie que deba quedar)
+    for nodo in camino:
+        nodo[3] += 1
+        top = nodo[2]
+        if len(top) < trie["k"] or peso > pesos[top[-1]]:
+            j = len(top)
+            while j > 0 and pesos[top[j - 1]] < peso:
+                j -= 1
+            top.insert(j, ident)
+            if len(top) > trie["k"]:
+                top.pop()
+
+
+def _trie_cambiar_peso(trie: dict[str, object], clave: str, ident: object, peso: int) -> None:
+    """Actualiza el peso de 'ident' y recalcula los top del camino de abajo hacia arriba."""
+    camino = _trie_camino(trie, clave, crear=False)
+    if camino is None or ident not in trie["pesos"]:
+        return
+    pesos = trie["pesos"]
+    pesos[ident] = peso
+    for nodo in reversed(camino):
+        top = nodo[2]
+        if ident not in top and len(top) >= trie["k"] and peso <= pesos[top[-1]]:
+            break  # no estaba ni entra en este top: los de arriba tampoco cambian
+        # el top de un nodo sale de sus propios ids y de los top de sus hijos
+        candidatos = list(nodo[1] or [])
+        for hijo in (nodo[0] or {}).values():
+            candidatos.extend(hijo[2])
+        candidatos.sort(key=lambda i: pesos[i], reverse=True)
+        nodo[2] = candidatos[:trie["k"]]
+
+
+def _trie_completar(trie: dict[str, object], prefijo: str, n: int) -> tuple[list, int]:
+    """Devuelve (hasta n ids con ese prefijo de mayor a menor peso, total con ese prefijo)."""
+    camino = _trie_camino(trie, prefijo, crear=False)
+    if camino is None:
+        return ([], 0)
+    nodo = camino[-1]
+    if n <= trie["k"]:
+        return (nodo[2][:n], nodo[3])
+    # más de K: recorrer el subárbol completo
+    todos: list = []
+    pendientes = [nodo]
+    while pendientes:
+        actual = pendientes.pop()
+        todos.extend(actual[1] or [])
+        pendientes.extend((actual[0] or {}).values())
+    pesos = trie["pesos"]
+    todos.sort(key=lambda i: pesos[i], reverse=True)
+    return (todos[:n], nodo[3])
+
+
+def _trie_nombres(datos: list[dict[str, object]], ind: dict[str, object]) -> dict[str, object]:
+    """Trie de nombres normalizados (ids = índices en datos, peso = población)."""
+    trie = ind.get("trie_nombres")
+    if trie is None:
+        trie = _trie_nuevo()
+        trie["n"] = 0
+        ind["trie_nombres"] = trie
+    for i in range(trie["n"], len(datos)):
+        r = datos[i]
+        _trie_insertar(trie, normalizar_busqueda(str(r.get("nombre", ""))), i, int(r["poblacion"]))
+    trie["n"] = len(datos)
+    return trie
+
+
+def _trie_continentes(datos: list[dict[str, object]], ind: dict[str, object]) -> dict[str, object]:
+    """Trie de continentes (ids = forma canónica, peso = población total del continente)."""
+    trie = ind.get("trie_continentes")
+    if trie is None:
+        trie = _trie_nuevo()
+        trie["n"] = 0
+        trie["canon"] = {}     # raw.lower() -> forma mostrada (la primera que aparece)
+        trie["opciones"] = []  # canónicos ordenados para el menú
+        ind["trie_continentes"] = trie
+    canon = trie["canon"]
+    for i in range(trie["n"], len(datos)):
+        r = datos[i]
+        raw = str(r.get("continente", "")).strip()
+        if not raw:
+            continue
+        if raw.lower() not in canon:
+            canon[raw.lower()] = raw
+            _trie_insertar(trie, normalizar_busqueda(raw), raw, int(r["poblacion"]))
+            trie["opciones"] = sorted(canon.values(), key=lambda s: s.casefold())
+        else:
+            c = canon[raw.lower()]
+            _trie_cambiar_peso(trie, normalizar_busqueda(c), c, trie["pesos"][c] + int(r["poblacion"]))
+    trie["n"] = len(datos)
+    return trie
+
+
+def _trie_actualizar_poblacion(datos: list[dict[str, object]], ind: dict[str, object], idx: int, anterior: dict[str, object]) -> None:
+    """Refleja en los tries un cambio de población de datos[idx]."""
+    r = datos[idx]
+    nueva = int(r["poblacion"])
+    delta = nueva - int(anterior.get("poblacion", 0))
+    if delta == 0:
+        return
+    if "trie_nombres" in ind and idx < ind["trie_nombres"]["n"]:
+        _trie_cambiar_peso(ind["trie_nombres"], normalizar_busqueda(str(r.get("nombre", ""))), idx, nueva)
+    if "trie_continentes" in ind and idx < ind["trie_continentes"]["n"]:
+        trie = ind["trie_continentes"]
+        c = trie["canon"].get(str(r.get("continente", "")).strip().lower())
+        if c is not None:
+            _trie_cambiar_peso(trie, normalizar_busqueda(c), c, trie["pesos"][c] + delta)
+
+
+#================# Función autocompletar_nombre =================#
+#==Países cuyo nombre empieza con el prefijo, de mayor a menor población==#
+def autocompletar_nombre(datos: list[dict[str, object]], prefijo: str, n: int = 5, sesion: dict[str, object] | None = None) -> list[dict[str, object]]:
+    return [datos[i] for i in _indices_autocompletar(datos, prefijo, n, sesion)[0]]
+
+
+def _indices_autocompletar(datos: list[dict[str, object]], prefijo: str, n: int, sesion: dict[str, object] | None = None) -> tuple[list[int], int]:
+    q = normalizar_busqueda(prefijo)
+    if q == "":
+        return ([], 0)
+    return _trie_completar(_trie_nombres(datos, _indices(sesion)), q, n)
+
+
+#================# Función autocompletar_continente =================#
+#==Continentes que empiezan con el prefijo, de mayor a menor población total==#
+def autocompletar_continente(datos: list[dict[str, object]], prefijo: str, n: int = 5, sesion: dict[str, object] | None = None) -> list[str]:
+    return _trie_completar(_trie_continentes(datos, _indices(sesion)), normalizar_busqueda(prefijo), n)[0]
+
+
+#=========================#
+#  Países similares (k-d tree sobre log10 de población y superficie)
+#  - Coordenadas normalizadas (z-score) para que ambos ejes pesen igual
+#  - Altas y cambios quedan "pendientes" y se revisan por fuerza bruta;
+#    el árbol se reconstruye recién cuando los pendientes superan √n
+#=========================#
+def _kd_coordenadas(pob: int, sup: int) -> tuple[float, float]:
+    return (math.log10(pob + 1), math.log10(sup))
+
+
+def _kd_construir(puntos: list[tuple[float, float, int]], eje: int = 0) -> list | None:
+    """Nodo: [(x, y), índice, eje, izquierdo, derecho]; mediana por eje alternado."""
+    if not puntos:
+        return None
+    puntos.sort(key=lambda p: p[eje])
+    m = len(puntos) // 2
+    x, y, i = puntos[m]
+    sig = 1 - eje
+    return [(x, y), i, eje, _kd_construir(puntos[:m], sig), _kd_construir(puntos[m + 1:], sig)]
+
+
+def _kd_indice(datos: list[dict[str, object]], ind: dict[str, object]) -> dict[str, object]:
+    """k-d tree del dataset; lo (re)construye si no existe o hay demasiados pendientes."""
+    kd = ind.get("kd")
+    pendientes = 0 if kd is None else len(kd["sucios"]) + len(datos) - kd["n"]
+    if kd is None or pendientes > max(16, math.isqrt(len(datos))):
+        crudos = [_kd_coordenadas(p, s) for p, s, _ in _iterar_numericos(datos)]
+        n = len(crudos)
+        media = [sum(c[e] for c in crudos) / n if n else 0.0 for e in (0, 1)]
+        desvio = [math.sqrt(sum((c[e] - media[e]) ** 2 for c in crudos) / n) if n else 1.0 for e in (0, 1)]
+        desvio = [d if d > 0 else 1.0 for d in desvio]
+        puntos = [((c[0] - media[0]) / desvio[0], (c[1] - media[1]) / desvio[1], i) for i, c in enumerate(crudos)]
+        kd = {"raiz": _kd_construir(puntos), "n": n, "media": media, "desvio": desvio, "sucios": set()}
+        ind["kd"] = kd
+    return kd
+
+
+def _kd_normalizar(kd: dict[str, object], pob: int, sup: int) -> tuple[float, float]:
+    c = _kd_coordenadas(pob, sup)
+    return ((c[0] - kd["media"][0]) / kd["desvio"][0], (c[1] - kd["media"][1]) / kd["desvio"][1])
+
+
+def _kd_pendientes(datos: list[dict[str, object]], kd: dict[str, object]):
+    """(punto normalizado, índice) de registros cambiados o agregados desde la construcción."""
+    for i in sorted(kd["sucios"]) + list(range(kd["n"], len(datos))):
+        r = datos[i]
+        yield (_kd_normalizar(kd, int(r["poblacion"]), int(r["superficie"])), i)
+
+
+def _kd_vecinos(datos: list[dict[str, object]], kd: dict[str, object], q: tuple[float, float],
+                k: int | None, radio: float | None, excluir: set[int]) -> list[tuple[float, int]]:
+    """Los k más cercanos (k) o todos dentro del radio (radio), como (distancia, índice)."""
+    mejores: list[tuple[float, int]] = []  # heap de (-distancia², índice) para k vecinos
+    dentro: list[tuple[float, int]] = []
+
+    def considerar(punto: tuple[float, float], i: int) -> None:
+        if i in excluir:
+            return
+        d2 = (punto[0] - q[0]) ** 2 + (punto[1] - q[1]) ** 2
+        if k is not None:
+            if len(mejores) < k:
+                heapq.heappush(mejores, (-d2, i))
+            elif d2 < -mejores[0][0]:
+                heapq.heapreplace(mejores, (-d2, i))
+        elif d2 <= radio * radio:
+            dentro.append((d2, i))
+
+    def limite2() -> float:
+        if k is not None:
+            return -mejores[0][0] if len(mejores) == k else math.inf
+        return radio * radio
+
+    pila = [kd["raiz"]] if kd["raiz"] is not None else []
+    while pila:
+        nodo = pila.pop()
+        if nodo is None:
+            continue
+        punto, i, eje = nodo[0], nodo[1], nodo[2]
+        if i not in kd["sucios"]:  # los cambiados se evalúan con su valor actual más abajo
+            considerar(punto, i)
+        dif = q[eje] - punto[eje]
+        cerca, lejos = (nodo[3], nodo[4]) if dif < 0 else (nodo[4], nodo[3])
+        # el lado lejano sólo se revisa si el plano de corte está dentro del límite actual
+        if dif * dif <= limite2():
+            pila.append(lejos)
+        pila.append(cerca)
+    for punto, i in _kd_pendientes(datos, kd):
+        considerar(punto, i)
+
+    if k is not None:
+        res = [(-d2, i) for d2, i in mejores]
+    else:
+        res = dentro
+    return sorted((math.sqrt(d2), i) for d2, i in res)
+
+
+#================# Función paises_similares =================#
+#==Países más parecidos en población y superficie a un registro de referencia==#
+def paises_similares(datos: list[dict[str, object]], ref: dict[str, object], k: int | None = 10,
+                     radio: float | None = None, sesion: dict[str, object] | None = None) -> list[tuple[float, dict[str, object]]]:
+    """
+    Devuelve (distancia, registro) ordenados de más a menos parecido, sin incluir
+    a la referencia. Con radio != None devuelve todos los que están a esa
+    distancia o menos (en desvíos estándar de log10 de población/superficie).
+    En modo fuera de memoria (CSVMapeado) devuelve []: el k-d tree guardaría
+    un punto por registro en memoria.
+    """
+    if not datos or (k is None and radio is None) or isinstance(datos, CSVMapeado):
+        return []
+    kd = _kd_indice(datos, _indices(sesion))
+    q = _kd_normalizar(kd, int(ref["poblacion"]), int(ref["superficie"]))
+    nombre_ref = normalizar_busqueda(str(ref.get("nombre", "")))
+    # se piden k+1 para poder descartar a la referencia (o a un homónimo exacto)
+    crudos = _kd_vecinos(datos, kd, q, None if radio is not None else k + 1, radio, set())
+    res = [(d, datos[i]) for d, i in crudos if normalizar_busqueda(str(datos[i].get("nombre", ""))) != nombre_ref]
+    return res if radio is not None else res[:k]
+
+
+def submenu_similares(datos: list[dict[str, object]], consulta: str, sesion: dict[str, object] | None = None) -> None:
+    """Busca la referencia con buscar_por_nombre y muestra sus vecinos más cercanos."""
+    candidatos = (buscar_por_nombre(datos, consulta, "exacta", sesion=sesion)
+                  or buscar_por_nombre(datos, consulta, "parcial", sesion=sesion))
+    if not candidatos:
+        print("[INFO] No se encontraron países para esa búsqueda.")
+        return
+    ref = candidatos[0]
+    if len(candidatos) > 1:
+        print(f"[OK] Se encontraron {len(candidatos)} coincidencia(s):")
+        for orden, r in enumerate(candidatos[:20], start=1):
+            print(f"{orden}) {r['nombre']}")
+        sel = input(f"Elija número [1-{min(len(candidatos), 20)}]: ").strip()
+        if not sel.isdigit() or not 1 <= int(sel) <= min(len(candidatos), 20):
+            print("[ERROR] Opción fuera de rango.")
+            return
+        ref = candidatos[int(sel) - 1]
+    txt = input("Cantidad de vecinos (Enter = 10) o radio como r=0.5: ").strip().lower().replace(",", ".")
+    k: int | None = 10
+    radio: float | None = None
+    if txt.startswith("r="):
+        r_txt = txt[2:]
+        if not r_txt.replace(".", "", 1).isdigit():
+            print("[ERROR] Radio inválido.")
+            return
+        radio, k = float(r_txt), None
+    elif txt != "":
+        if not txt.isdigit() or int(txt) <= 0:
+            print("[ERROR] Debe ingresar un entero positivo.")
+            return
+        k = int(txt)
+    print("[OK] Referencia:")
+    mostrar_registro(ref)
+    similares = paises_similares(datos, ref, k, radio, sesion)
+    if not similares:
+        print("[INFO] No hay países similares con ese criterio.")
+        return
+    print(f"[OK] {len(similares)} país(es) similar(es) (distancia en desvíos estándar):")
+    lineas = formatear_registros([r for _, r in similares]).splitlines(keepends=True)
+    sys.stdout.write("".join(f"  [{d:.3f}] {linea}" for (d, _), linea in zip(similares, lineas)))
+
+
+#=========================#
+#  Búsqueda difusa (BK-tree sobre nombres normalizados)
+#=========================#
+#================# Función distancia_edicion =================#
+#==Distancia de Levenshtein (inserción, borrado y sustitución cuestan 1)==#
+def distancia_edicion(a: str, b: str) -> int:
+    if len(a) < len(b):
+        a, b = b, a
+    previa = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        actual = [i]
+        for j, cb in enumerate(b, start=1):
+            actual.append(min(previa[j] + 1, actual[j - 1] + 1, previa[j - 1] + (ca != cb)))
+        previa = actual
+    return previa[-1]
+
+
+#==Nodo del BK-tree: [clave, índices de registros con esa clave, {distancia: hijo}]==#
+def _bk_insertar(arbol: dict[str, object], clave: str, idx: int) -> None:
+    nodo = arbol["raiz"]
+    if nodo is None:
+        arbol["raiz"] = [clave, [idx], {}]
+        return
+    while True:
+        d = distancia_edicion(clave, nodo[0])
+        if d == 0:
+            nodo[1].append(idx)
+            return
+        hijo = nodo[2].get(d)
+        if hijo is None:
+            nodo[2][d] = [clave, [idx], {}]
+            return
+        nodo = hijo
+
+
+def _bk_sincronizar(datos: list[dict[str, object]], ind: dict[str, object]) -> dict[str, object]:
+    """Crea el BK-tree si falta e inserta los registros agregados desde la última vez."""
+    arbol = ind.get("bk")
+    if arbol is None:
+        arbol = {"raiz": None, "n": 0}
+        ind["bk"] = arbol
+    for i in range(arbol["n"], len(datos)):
+        _bk_insertar(arbol, normalizar_busqueda(str(datos[i].get("nombre", ""))), i)
+    arbol["n"] = len(datos)
+    return arbol
+
+
+def _bk_buscar(arbol: dict[str, object], q: str, tolerancia: int) -> list[tuple[int, int]]:
+    """Devuelve (distancia, índice) de todas las claves a distancia <= tolerancia."""
+    res: list[tuple[int, int]] = []
+    pendientes = [arbol["raiz"]] if arbol["raiz"] is not None else []
+    while pendientes:
+        nodo = pendientes.pop()
+        d = distancia_edicion(q, nodo[0])
+        if d <= tolerancia:
+            res.extend((d, i) for i in nodo[1])
+        # desigualdad triangular: sólo pueden servir hijos en [d - tol, d + tol]
+        for dist_hijo, hijo in nodo[2].items():
+            if d - tolerancia <= dist_hijo <= d + tolerancia:
+                pendientes.append(hijo)
+    return res
+
+
+def tolerancia_difusa(consulta: str) -> int:
+    """Errores tolerados según el largo de la consulta (1 a 3)."""
+    return max(1, min(3, len(consulta) // 3))
+
+
 #=========================#
 #  Gestión de países (CRUD principal)
 #  - Búsqueda por nombre (parcial) y selección si hay múltiples
 #=========================#
 def _indices_coinciden_nombre(datos: list[dict[str, object]], consulta: str) -> list[int]:
     """
-    Devuelve los índices de los registros cuyo nombre contiene la consulta (case-insensitive).
+    Devuelve los índices de los registros cuyo nombre contiene la consulta
+    (sin distinguir mayúsculas ni acentos).
     """
-    q = normalizar_texto(consulta)
+    q = normalizar_busqueda(consulta)
     if q == "":
         return []
     idxs: list[int] = []
     for i, r in enumerate(datos):
-        if q in normalizar_texto(str(r.get("nombre", ""))):
+        if q in normalizar_busqueda(str(r.get("nombre", ""))):
             idxs.append(i)
     return idxs
 
-def actualizar_pais(datos: list[dict[str, object]]) -> None:
+def actualizar_pais(datos: list[dict[str, object]], sesion: dict[str, object] | None = None) -> None:
     if not datos:
         print("[INFO] No hay datos cargados. Use la opción 1 primero.")
         return
@@ -743,7 +2352,11 @@ def actualizar_pais(datos: list[dict[str, object]]) -> None:
         print("[ERROR] La búsqueda no puede estar vacía.")
         return
 
-    coincidencias = _indices_coinciden_nombre(datos, q)
+    # Primero los que empiezan con la consulta (trie, de mayor a menor población),
+    # después el resto de la búsqueda parcial (ej. "guinea" también lista "Papúa Nueva Guinea")
+    primeros, _ = _indices_autocompletar(datos, q, TOP_AUTOCOMPLETAR, sesion)
+    ya_listados = set(primeros)
+    coincidencias = primeros + [i for i in _indices_coinciden_nombre(datos, q) if i not in ya_listados]
     if len(coincidencias) == 0:
         print("[INFO] No se encontraron países para esa búsqueda.")
         return
@@ -796,8 +2409,10 @@ def actualizar_pais(datos: list[dict[str, object]]) -> None:
         nueva_sup = int(actual["superficie"])
 
     # Aplicar cambios
+    anterior = dict(actual)
     actual["poblacion"] = nueva_pob
     actual["superficie"] = nueva_sup
+    registrar_cambio(datos, idx, anterior, sesion=sesion)
 
     print("\n[OK] País actualizado:")
     mostrar_registro(actual)
@@ -805,7 +2420,7 @@ def actualizar_pais(datos: list[dict[str, object]]) -> None:
 #=========================#
 # Agregar país 
 #=========================#
-def agregar_pais(datos: list[dict[str, object]]) -> None:
+def agregar_pais(datos: list[dict[str, object]], sesion: dict[str, object] | None = None) -> None:
     print("\n--- Agregar país ---")
 
     # Nombre
@@ -835,16 +2450,16 @@ def agregar_pais(datos: list[dict[str, object]]) -> None:
         return
 
     # Continente (elegir de lista — respeta capitalización/acentos existentes)
-    continente = elegir_continente(datos).strip()
+    continente = elegir_continente(datos, sesion).strip()
     if continente == "":
         print("[ERROR] No se permiten campos vacíos (continente).")
         return
 
-    # Duplicados por nombre (case-insensitive)
-    nombre_norm = normalizar_texto(nombre)
+    # Duplicados por nombre (sin distinguir mayúsculas ni acentos)
+    nombre_norm = normalizar_busqueda(nombre)
     existe = False
     for r in datos:
-        if normalizar_texto(str(r.get("nombre", ""))) == nombre_norm:
+        if normalizar_busqueda(str(r.get("nombre", ""))) == nombre_norm:
             existe = True
             break
     if existe:
@@ -858,23 +2473,584 @@ def agregar_pais(datos: list[dict[str, object]]) -> None:
         "superficie": superficie,
         "continente": continente,
     })
+    registrar_alta(datos, len(datos) - 1, sesion=sesion)
     print(f"[OK] País agregado: {nombre} (Continente: {continente})")
 #==========================================================#
 
 #================# Funcion buscar_por_nombre=================#
-def buscar_por_nombre(datos: list[dict[str, object]], consulta: str, modo: str = "parcial") -> list[dict[str, object]]:
-    q = normalizar_texto(consulta)
+def buscar_por_nombre(datos: list[dict[str, object]], consulta: str, modo: str = "parcial",
+                      tolerancia: int | None = None, sesion: dict[str, object] | None = None) -> list[dict[str, object]]:
+    """
+    Modos: "exacta", "parcial" (default) y "difusa".
+    No distingue mayúsculas ni acentos. En modo difusa devuelve los nombres a
+    distancia de edición <= tolerancia (por defecto según el largo de la consulta),
+    del más parecido al menos parecido, usando el BK-tree del dataset.
+    En modo fuera de memoria (CSVMapeado) la búsqueda difusa devuelve []:
+    el BK-tree obligaría a cargar todos los nombres.
+    """
+    q = normalizar_busqueda(consulta)
     if not q:
         return []
+    if modo == "difusa" and isinstance(datos, CSVMapeado):
+        return []
+    modo = modo if modo in ("exacta", "difusa") else "parcial"
+    if modo == "difusa" and tolerancia is None:
+        tolerancia = tolerancia_difusa(q)
+    return consultar_con_cache(sesion, ("nombre", modo, q, tolerancia), lambda: _buscar_por_nombre(datos, q, modo, tolerancia, sesion))
+
+
+def _buscar_por_nombre(datos: list[dict[str, object]], q: str, modo: str, tolerancia: int | None,
+                       sesion: dict[str, object] | None) -> list[dict[str, object]]:
     if modo == "exacta":
-        return [r for r in datos if normalizar_texto(str(r.get("nombre",""))) == q]
+        return [r for r in datos if normalizar_busqueda(str(r.get("nombre",""))) == q]
+    if modo == "difusa":
+        arbol = _bk_sincronizar(datos, _indices(sesion))
+        encontrados = sorted(_bk_buscar(arbol, q, tolerancia))
+        return [datos[i] for _, i in encontrados]
     # parcial (default)
-    return [r for r in datos if q in normalizar_texto(str(r.get("nombre","")))]
+    return [r for r in datos if q in normalizar_busqueda(str(r.get("nombre","")))]
 
 #============================================================#
 
 
 
+#=========================#
+#  Comparar y fusionar con otro CSV (por ejemplo, el censo del mes)
+#  - Join por nombre normalizado: índice en memoria del dataset actual
+#    y el CSV nuevo se recorre fila por fila, sin cargarlo completo
+#  - Sólo se guardan los totales y las primeras diferencias de cada tipo;
+#    al fusionar se vuelve a recorrer el CSV nuevo
+#=========================#
+def politicas_fusion() -> tuple[str, ...]:
+    # altas_y_cambios: agrega y actualiza, conserva los que faltan en el nuevo
+    # espejo: además quita los que faltan en el nuevo
+    # solo_altas: sólo agrega países nuevos
+    return ("altas_y_cambios", "espejo", "solo_altas")
+
+
+def _diferencias_campos(actual: dict[str, object], nuevo: dict[str, object]) -> dict[str, tuple]:
+    """{campo: (antes, después)} de los campos que cambiaron."""
+    cambios: dict[str, tuple] = {}
+    for campo in campos_csv():
+        if campo in ("poblacion", "superficie"):
+            antes, despues = int(actual[campo]), int(nuevo[campo])
+        else:
+            antes, despues = str(actual[campo]).strip(), str(nuevo[campo]).strip()
+        if antes != despues:
+            cambios[campo] = (antes, despues)
+    return cambios
+
+
+#================# Función comparar_con_csv =================#
+#==Altas, bajas y cambios (campo por campo) entre los datos actuales y otro CSV==#
+def _abrir_csv_nuevo(ruta: str):
+    """(archivo, lector) del CSV a comparar, o None si no es válido."""
+    if not isinstance(ruta, str) or ruta.strip() == "":
+        print("[ERROR] Ruta inválida.")
+        return None
+    if not os.path.exists(ruta):
+        print(f"[ERROR] No se encontró el archivo: {ruta}")
+        return None
+    f = open(ruta, "r", encoding="utf-8-sig", newline="")
+    lector = csv.DictReader(f)
+    fieldnames = lector.fieldnames if lector.fieldnames is not None else []
+    faltantes = [c for c in campos_csv() if c not in fieldnames]
+    if len(faltantes) > 0:
+        print(f"[ERROR] Encabezados faltantes: {faltantes}. Se esperaban: {campos_csv()}")
+        f.close()
+        return None
+    return (f, lector)
+
+
+def _recorrer_diferencias(datos: list[dict[str, object]], lector, vistos: bytearray, avisar: bool):
+    """
+    Recorre el CSV nuevo fila por fila y devuelve, por cada fila, ("alta", registro),
+    ("cambio", (índice, registro, {campo: (antes, después)})), ("igual", None) o
+    ("error", None). Marca en 'vistos' los índices de 'datos' que aparecen en el CSV
+    nuevo (sólo los primeros len(vistos) registros, los que había al empezar).
+    """
+    # Índice hash del dataset actual: nombre normalizado -> índice
+    por_nombre: dict[str, int] = {}
+    for i in range(len(vistos)):
+        por_nombre.setdefault(normalizar_busqueda(str(datos[i].get("nombre", ""))), i)
+    nuevos_vistos: set[str] = set()  # nombres de altas, para detectar repetidos en el CSV nuevo
+    fila_nro = 1
+    for fila in lector:
+        fila_nro += 1
+        registro, motivo = _validar_fila_csv(fila)
+        if registro is None:
+            if avisar:
+                print(f"[AVISO] Fila {fila_nro} inválida: {motivo}. Se omite.")
+            yield ("error", None)
+            continue
+        clave = normalizar_busqueda(str(registro["nombre"]))
+        i = por_nombre.get(clave)
+        if (i is None and clave in nuevos_vistos) or (i is not None and vistos[i]):
+            if avisar:
+                print(f"[AVISO] Fila {fila_nro} inválida: país repetido. Se omite.")
+            yield ("error", None)
+            continue
+        if i is None:
+            nuevos_vistos.add(clave)
+            yield ("alta", registro)
+            continue
+        vistos[i] = 1
+        cambios = _diferencias_campos(datos[i], registro)
+        yield ("cambio", (i, registro, cambios)) if cambios else ("igual", None)
+
+
+def comparar_con_csv(datos: list[dict[str, object]], ruta: str, limite: int = 50,
+                     sesion: dict[str, object] | None = None) -> dict[str, object] | None:
+    """
+    Devuelve {"altas": [registro], "bajas": [índice], "cambios": [(índice, registro nuevo,
+    {campo: (antes, después)})], "n_altas", "n_bajas", "n_cambios", "iguales", "errores"}
+    o None si el archivo no es válido. Las listas guardan sólo las primeras 'limite'
+    diferencias de cada tipo (para mostrarlas); los n_* son los totales. Las filas del
+    CSV nuevo se validan igual que en cargar_csv y se recorren una por una: la memoria
+    extra es el índice por nombre de los datos actuales, no el CSV nuevo.
+    En modo fuera de memoria (CSVMapeado) no compara: el índice tendría todos los nombres.
+    """
+    if isinstance(datos, CSVMapeado):
+        print("[INFO] Modo fuera de memoria: comparar con otro CSV no está disponible. Cargue el CSV en modo normal.")
+        return None
+    abierto = _abrir_csv_nuevo(ruta)
+    if abierto is None:
+        return None
+    f, lector = abierto
+    st = os.stat(ruta)
+    res: dict[str, object] = {
+        "ruta": ruta, "firma": (st.st_size, st.st_mtime_ns), "version": version_datos(sesion),
+        "altas": [], "bajas": [], "cambios": [], "n_altas": 0, "n_bajas": 0, "n_cambios": 0,
+        "iguales": 0, "errores": 0, "limite": limite,
+    }
+    vistos = bytearray(len(datos))  # 1 = el país también está en el CSV nuevo
+    for tipo, dato in _recorrer_diferencias(datos, lector, vistos, avisar=True):
+        if tipo == "alta":
+            res["n_altas"] += 1
+            if len(res["altas"]) < limite:
+                res["altas"].append(dato)
+        elif tipo == "cambio":
+            res["n_cambios"] += 1
+            if len(res["cambios"]) < limite:
+                res["cambios"].append(dato)
+        elif tipo == "igual":
+            res["iguales"] += 1
+        else:
+            res["errores"] += 1
+    f.close()
+
+    # Los que no aparecieron en el CSV nuevo son bajas
+    for i, v in enumerate(vistos):
+        if not v:
+            res["n_bajas"] += 1
+            if len(res["bajas"]) < limite:
+                res["bajas"].append(i)
+    return res
+
+
+def mostrar_diferencias(datos: list[dict[str, object]], dif: dict[str, object], limite: int = 50) -> None:
+    print(f"[OK] Altas: {dif['n_altas']} | Bajas: {dif['n_bajas']} | Cambios: {dif['n_cambios']} | "
+          f"Sin cambios: {dif['iguales']} | Filas con error: {dif['errores']}")
+    lineas: list[str] = []
+    for r in dif["altas"][:limite]:
+        lineas.append(f"+ {r['nombre']} | Población: {_miles(r['poblacion'])} | "
+                      f"Superficie: {_miles(r['superficie'])} km² | Continente: {r['continente']}\n")
+    for i in dif["bajas"][:limite]:
+        lineas.append(f"- {datos[i]['nombre']}\n")
+    for i, _, cambios in dif["cambios"][:limite]:
+        partes = []
+        for campo, (antes, despues) in cambios.items():
+            if campo in ("poblacion", "superficie"):
+                delta = despues - antes
+                partes.append(f"{campo}: {_miles(antes)} -> {_miles(despues)} ({'+' if delta > 0 else ''}{_miles(delta)})")
+            else:
+                partes.append(f"{campo}: {antes} -> {despues}")
+        lineas.append(f"~ {datos[i]['nombre']}: " + " | ".join(partes) + "\n")
+    sys.stdout.write("".join(lineas))
+    limite = min(limite, dif["limite"])  # la comparación guarda a lo sumo dif["limite"] de cada tipo
+    if max(dif["n_altas"], dif["n_bajas"], dif["n_cambios"]) > limite:
+        print(f"[INFO] Se muestran hasta {limite} de cada tipo.")
+
+
+#================# Función aplicar_fusion =================#
+#==Aplica las diferencias según la política elegida (modifica 'datos')==#
+#==Vuelve a recorrer el CSV nuevo en lugar de guardar todas las diferencias==#
+def aplicar_fusion(datos: list[dict[str, object]], dif: dict[str, object], politica: str,
+                   sesion: dict[str, object] | None = None) -> bool:
+    if politica not in politicas_fusion():
+        print(f"[ERROR] Política no válida. Use una de: {list(politicas_fusion())}")
+        return False
+    ruta = dif["ruta"]
+    st = os.stat(ruta) if os.path.isfile(ruta) else None
+    if st is None or (st.st_size, st.st_mtime_ns) != dif["firma"] or version_datos(sesion) != dif["version"]:
+        print("[ERROR] Los datos o el CSV a comparar cambiaron desde la comparación. Vuelva a comparar.")
+        return False
+    abierto = _abrir_csv_nuevo(ruta)
+    if abierto is None:
+        return False
+    f, lector = abierto
+    vistos = bytearray(len(datos))
+    altas = cambios = 0
+    for tipo, dato in _recorrer_diferencias(datos, lector, vistos, avisar=False):
+        if tipo == "alta":
+            datos.append(dict(dato))
+            registrar_alta(datos, len(datos) - 1, sesion=sesion)
+            altas += 1
+        elif tipo == "cambio" and politica != "solo_altas":
+            i, nuevo, _ = dato
+            anterior = dict(datos[i])
+            datos[i].update(nuevo)
+            registrar_cambio(datos, i, anterior, sesion=sesion)
+            cambios += 1
+    f.close()
+    bajas = 0
+    if politica == "espejo":
+        quitar = {i for i, v in enumerate(vistos) if not v}
+        if quitar:
+            datos[:] = [r for i, r in enumerate(datos) if i not in quitar]  # misma lista, sin las bajas
+            registrar_recarga(datos, sesion)
+            bajas = len(quitar)
+    print(f"[OK] Fusión aplicada ({politica}): {altas} alta(s), {cambios} cambio(s), {bajas} baja(s).")
+    return True
+
+
+def submenu_fusion(datos: list[dict[str, object]], sesion: dict[str, object] | None = None) -> bool:
+    """Compara con otro CSV y, si el usuario quiere, fusiona. True si hubo cambios."""
+    ruta = input("Ruta del CSV a comparar: ").strip()
+    dif = comparar_con_csv(datos, ruta, sesion=sesion)
+    if dif is None:
+        return False
+    mostrar_diferencias(datos, dif)
+    if not dif["n_altas"] and not dif["n_cambios"] and not dif["n_bajas"]:
+        print("[INFO] No hay diferencias.")
+        return False
+    op = input("Aplicar (Enter = no / A = altas y cambios / E = espejo, también bajas / S = solo altas): ").strip().lower()
+    politica = {"a": "altas_y_cambios", "e": "espejo", "s": "solo_altas"}.get(op)
+    if politica is None:
+        print("[INFO] No se aplicaron cambios.")
+        return False
+    return aplicar_fusion(datos, dif, politica, sesion)
+
+
+#=========================#
+#  Vigilancia del CSV en disco (recarga incremental)
+#  - Un hilo revisa tamaño/mtime cada pocos segundos
+#  - El archivo se divide en bloques de líneas (cortes definidos por el
+#    contenido) y se guarda el hash de cada bloque: sólo se vuelven a leer
+#    y comparar los bloques que cambiaron
+#  - Los cambios se aplican en el hilo principal, antes de mostrar el menú
+#=========================#
+INTERVALO_VIGILANCIA = 2.0    # segundos entre revisiones
+_BLOQUE_MAX = 1 << 20         # un bloque nunca supera 1 MB
+
+
+#==Cambios locales sin guardar (para no pisarlos con lo que venga del disco)==#
+def nombres_sin_guardar(sesion: dict[str, object]) -> set[str]:
+    """Nombres normalizados con altas o cambios locales todavía no guardados."""
+    return set(sesion["editados"])
+
+
+def registrar_guardado(ruta: str, sesion: dict[str, object]) -> None:
+    """Los cambios locales ya están en disco; si se vigila ese archivo, se toma como nueva base."""
+    sesion["editados"] = set()
+    est = sesion["vigilancia"]
+    if est["hilo"] is not None and os.path.abspath(ruta) == est["ruta"]:
+        with est["lock"]:
+            _vigilancia_nueva_base(est)
+
+
+#================# Función sincronizar_antes_de_guardar =================#
+#==Guardar reescribe el CSV entero desde memoria: si se está vigilando ese==#
+#==archivo, primero se incorpora lo que cambió en disco y todavía no llegó==#
+#==a memoria; si no se puede, no se guarda (se perderían esos cambios).=====#
+def sincronizar_antes_de_guardar(ruta: str, datos: list[dict[str, object]], sesion: dict[str, object]) -> bool:
+    est = sesion["vigilancia"]
+    if est["hilo"] is None or os.path.abspath(ruta) != est["ruta"]:
+        return True
+    _revisar(est)  # no esperar al próximo intervalo del hilo
+    aplicar_cambios_externos(datos, sesion)
+    firma_disco = _firma_archivo(est["ruta"])
+    with est["lock"]:
+        al_dia = (est["pendiente"] is None and not est["encabezado_cambiado"]
+                  and (firma_disco is None or firma_disco == est["firma"]))
+    if not al_dia:
+        print("[AVISO] El CSV cambió en disco y esos cambios no se incorporaron a memoria. "
+              "No se guardó para no perderlos (recargue con la opción 1).")
+    return al_dia
+
+
+def _cortar_bloques(contenido: bytes, inicio: int, encabezados: list[str]) -> list[tuple]:
+    """
+    Divide contenido[inicio:] en bloques (desde, hasta, hash, filas), con
+    filas = ((clave del país, crc32 de su línea), ...).
+    El corte se hace después de las líneas cuyo crc32 termina en 6 bits en cero
+    (~64 líneas por bloque), así un cambio sólo altera los bloques que lo contienen.
+    El crc32 de cada línea queda como versión base de esa fila.
+    """
+    bloques: list[tuple] = []
+    desde = inicio
+    pos = inicio
+    filas: list[tuple[str, int]] = []
+    largo = len(contenido)
+    while pos < largo:
+        fin = contenido.find(b"\n", pos)
+        fin = largo if fin == -1 else fin + 1
+        linea = contenido[pos:fin]
+        h_linea = zlib.crc32(linea.rstrip(b"\r\n"))  # sin el fin de línea: agregar una fila al final no cambia la anterior
+        clave = _clave_linea(linea, encabezados)
+        if clave:
+            filas.append((clave, h_linea))
+        pos = fin
+        if h_linea & 63 == 0 or pos - desde >= _BLOQUE_MAX or pos == largo:
+            bloques.append((desde, pos, hashlib.blake2b(contenido[desde:pos], digest_size=16).digest(), tuple(filas)))
+            desde = pos
+            filas = []
+    return bloques
+
+
+def _clave_linea(linea: bytes, encabezados: list[str]) -> str:
+    texto = linea.decode("utf-8", errors="replace").rstrip("\r\n")
+    if texto.strip() == "":
+        return ""
+    fila = dict(zip(encabezados, _campos_linea(texto)))
+    return normalizar_busqueda(str(fila.get("nombre", "")))
+
+
+def _registros_linea(contenido: bytes, encabezados: list[str]) -> list[dict[str, object]]:
+    """Registros válidos de un fragmento del CSV (las filas inválidas se omiten)."""
+    res: list[dict[str, object]] = []
+    for texto in contenido.decode("utf-8", errors="replace").splitlines():
+        if texto.strip() == "":
+            continue
+        registro, _ = _validar_fila_csv(dict(zip(encabezados, _campos_linea(texto))))
+        if registro is not None:
+            res.append(registro)
+    return res
+
+
+def _firma_archivo(ruta: str) -> tuple[int, int] | None:
+    """(tamaño, mtime) del archivo, o None si ya no existe."""
+    if not os.path.isfile(ruta):
+        return None
+    st = os.stat(ruta)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _leer_archivo(ruta: str) -> tuple[bytes, int, list[str]] | None:
+    """(contenido, posición de la primera fila, encabezados), o None si el archivo ya no existe."""
+    if not os.path.isfile(ruta):
+        return None
+    f = open(ruta, "rb")
+    contenido = f.read()
+    f.close()
+    inicio = 3 if contenido[:3] == b"\xef\xbb\xbf" else 0
+    fin = contenido.find(b"\n", inicio)
+    fin = len(contenido) if fin == -1 else fin + 1
+    encabezados = [c.strip() for c in _campos_linea(contenido[inicio:fin].decode("utf-8", errors="replace").rstrip("\r\n"))]
+    return (contenido, fin, encabezados)
+
+
+def _vigilancia_nueva_base(est: dict[str, object]) -> None:
+    """Toma el contenido actual del archivo como referencia (llamar con el lock tomado)."""
+    firma = _firma_archivo(est["ruta"])
+    leido = _leer_archivo(est["ruta"])
+    if firma is None or leido is None:  # el archivo desapareció: sin base hasta que vuelva
+        est["firma"] = None
+        est["encabezados"] = []
+        est["bloques"] = []
+    else:
+        contenido, inicio, encabezados = leido
+        est["firma"] = firma
+        est["encabezados"] = encabezados
+        est["bloques"] = _cortar_bloques(contenido, inicio, encabezados)
+    est["pendiente"] = None
+    est["encabezado_cambiado"] = False
+
+
+def _detectar_cambios(ruta: str, base: list[tuple], encabezados_base: list[str]) -> dict[str, object] | None:
+    """
+    Compara el archivo con los bloques de referencia. Los bloques iniciales se
+    verifican sólo con su hash (sin separar líneas); desde el primero distinto
+    se vuelve a cortar el resto y se comparan los hashes de ambos lados.
+    Dentro de los bloques distintos sólo se devuelven las filas cuya línea
+    cambió respecto de la base (las vecinas que no se tocaron se ignoran).
+    None si el archivo ya no existe.
+    """
+    leido = _leer_archivo(ruta)
+    if leido is None:
+        return None
+    contenido, inicio, encabezados = leido
+    if encabezados != encabezados_base:
+        return {"encabezado": True}
+    iguales = 0
+    for desde, hasta, h, _ in base:
+        if hasta > len(contenido) or hashlib.blake2b(contenido[desde:hasta], digest_size=16).digest() != h:
+            break
+        iguales += 1
+    reanudar = base[iguales - 1][1] if iguales > 0 else inicio
+    nuevos = _cortar_bloques(contenido, reanudar, encabezados)
+    hashes_viejos = {b[2] for b in base[iguales:]}
+    hashes_nuevos = {b[2] for b in nuevos}
+    version_base: dict[str, int] = {}
+    for _, _, _, filas_base in base[iguales:]:
+        version_base.update(filas_base)
+    filas: list[dict[str, object]] = []
+    claves_presentes: set[str] = set()
+    for desde, hasta, h, filas_bloque in nuevos:
+        if h in hashes_viejos:
+            continue
+        claves_presentes.update(c for c, _ in filas_bloque)
+        cambiadas = {c for c, h_linea in filas_bloque if version_base.get(c) != h_linea}
+        if cambiadas:
+            filas.extend(r for r in _registros_linea(contenido[desde:hasta], encabezados)
+                         if normalizar_busqueda(str(r["nombre"])) in cambiadas)
+    quitadas: set[str] = set()
+    for _, _, h, filas_base in base[iguales:]:
+        if h not in hashes_nuevos:
+            quitadas.update(c for c, _ in filas_base)
+    # una clave que estaba en un bloque viejo pero sigue en otro bloque no es baja
+    todas = set()
+    for b in nuevos:
+        todas.update(c for c, _ in b[3])
+    return {
+        "encabezado": False,
+        "filas": filas,
+        "quitadas": quitadas - todas - claves_presentes,
+        "bloques": base[:iguales] + nuevos,
+        "leidos": sum(1 for b in nuevos if b[2] not in hashes_viejos),
+    }
+
+
+def _revisar(est: dict[str, object]) -> None:
+    """Una revisión del archivo vigilado; si no existe, se saltea y se avisa en el menú."""
+    with est["lock"]:
+        ruta = est["ruta"]
+        firma = est["firma"]
+        base = est["bloques"]
+        encabezados = est["encabezados"]
+    firma_disco = _firma_archivo(ruta)
+    if firma_disco is None:
+        est["ausente"] = True
+        return
+    est["ausente"] = False
+    if firma_disco == firma:
+        return
+    if firma is None:  # volvió a aparecer: se toma como nueva base
+        with est["lock"]:
+            _vigilancia_nueva_base(est)
+        return
+    cambios = _detectar_cambios(ruta, base, encabezados)
+    if cambios is None:
+        est["ausente"] = True
+        return
+    with est["lock"]:
+        if est["firma"] == firma:  # nadie tomó una base nueva mientras se comparaba
+            est["pendiente"] = cambios
+            est["firma"] = firma_disco
+
+
+def _vigilar(est: dict[str, object]) -> None:
+    while not est["detener"].wait(est["intervalo"]):
+        _revisar(est)
+
+
+#================# Función iniciar_vigilancia =================#
+def iniciar_vigilancia(ruta: str, datos: list[dict[str, object]], sesion: dict[str, object],
+                       intervalo: float = INTERVALO_VIGILANCIA) -> bool:
+    if not isinstance(datos, list) or not os.path.isfile(ruta):
+        print("[ERROR] Sólo se puede vigilar un CSV cargado en modo normal.")
+        return False
+    detener_vigilancia(sesion)
+    est = {"hilo": None, "ruta": os.path.abspath(ruta), "intervalo": intervalo,
+           "lock": threading.Lock(), "detener": threading.Event(), "ausente": False, "avisado": False}
+    _vigilancia_nueva_base(est)
+    est["hilo"] = threading.Thread(target=_vigilar, args=(est,), daemon=True)
+    sesion["vigilancia"] = est
+    est["hilo"].start()
+    print(f"[OK] Vigilando cambios en: {ruta} (cada {intervalo:g} s)")
+    return True
+
+
+def detener_vigilancia(sesion: dict[str, object]) -> None:
+    est = sesion["vigilancia"]
+    if est["hilo"] is not None:
+        est["detener"].set()
+        est["hilo"].join()
+        print("[INFO] Vigilancia detenida.")
+    sesion["vigilancia"] = {"hilo": None}
+
+
+def vigilancia_activa(sesion: dict[str, object]) -> bool:
+    hilo = sesion["vigilancia"]["hilo"]
+    return hilo is not None and hilo.is_alive()
+
+
+#================# Función aplicar_cambios_externos =================#
+#==Incorpora al dataset en memoria lo que cambió en disco (llamar desde el menú)==#
+def aplicar_cambios_externos(datos: list[dict[str, object]], sesion: dict[str, object]) -> None:
+    est = sesion["vigilancia"]
+    if est["hilo"] is None:
+        return
+    if not est["hilo"].is_alive():  # el hilo terminó por un error inesperado
+        sesion["vigilancia"] = {"hilo": None}
+        print("[AVISO] La vigilancia del CSV se detuvo por un error al leer el archivo. Use la opción 11 para reactivarla.")
+        return
+    if est["ausente"] != est["avisado"]:
+        est["avisado"] = est["ausente"]
+        if est["ausente"]:
+            print(f"[AVISO] El CSV vigilado ya no existe: {est['ruta']}. Se sigue revisando por si vuelve.")
+    with est["lock"]:
+        cambios = est["pendiente"]
+        est["pendiente"] = None
+        if cambios is not None and cambios["encabezado"]:
+            est["encabezado_cambiado"] = True
+    if cambios is None:
+        return
+    if cambios["encabezado"]:
+        print("[AVISO] Cambiaron los encabezados del CSV en disco. Use la opción 1 para recargar.")
+        return
+
+    sin_guardar = nombres_sin_guardar(sesion)
+    conflictos: list[str] = []
+    por_nombre = {normalizar_busqueda(str(r.get("nombre", ""))): i for i, r in enumerate(datos)}
+    altas = modificados = 0
+    for registro in cambios["filas"]:  # sólo filas que cambiaron en disco respecto de la base
+        clave = normalizar_busqueda(str(registro["nombre"]))
+        i = por_nombre.get(clave)
+        if i is not None and not _diferencias_campos(datos[i], registro):
+            continue  # en disco quedó igual que en memoria
+        if clave in sin_guardar:
+            conflictos.append(str(registro["nombre"]))
+            continue
+        if i is None:
+            datos.append(dict(registro))
+            por_nombre[clave] = len(datos) - 1
+            registrar_alta(datos, len(datos) - 1, local=False, sesion=sesion)
+            altas += 1
+        else:
+            anterior = dict(datos[i])
+            datos[i].update(registro)
+            registrar_cambio(datos, i, anterior, local=False, sesion=sesion)
+            modificados += 1
+    quitar: set[int] = set()
+    for clave in cambios["quitadas"]:
+        if clave in sin_guardar:
+            conflictos.append(str(datos[por_nombre[clave]]["nombre"]) if clave in por_nombre else clave)
+        elif clave in por_nombre:
+            quitar.add(por_nombre[clave])
+    if quitar:
+        datos[:] = [r for i, r in enumerate(datos) if i not in quitar]
+        registrar_recarga(datos, sesion)
+
+    with est["lock"]:
+        est["bloques"] = cambios["bloques"]
+    if altas or modificados or quitar:
+        print(f"[INFO] El CSV cambió en disco ({cambios['leidos']} bloque(s) releídos): "
+              f"{altas} alta(s), {modificados} cambio(s), {len(quitar)} baja(s) incorporados.")
+    for nombre in conflictos:
+        print(f"[AVISO] Conflicto: '{nombre}' cambió en disco pero tiene cambios locales sin guardar. Se conserva la versión local.")
+
+
 #================# Punto de entrada principal =================#
 if __name__ == "__main__": # Punto de entrada principal
     menu()  # Llama a la función del menú principal